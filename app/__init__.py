@@ -9,16 +9,17 @@ from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
 from apscheduler.schedulers.background import BackgroundScheduler
+from anyio import to_thread
 
 from .version import __version__
-from config import ALLOWED_ORIGINS, DOCS, XRAY_SUBSCRIPTION_PATH, DEBUG, HOME_PAGE_TEMPLATE
+from config import ALLOWED_ORIGINS, API_THREADPOOL_SIZE, DOCS, XRAY_SUBSCRIPTION_PATH, DEBUG, HOME_PAGE_TEMPLATE
 
 from app.db import init_db
 # Routers are imported via the main aggregator router
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.DEBUG if DEBUG else logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
@@ -90,6 +91,13 @@ def use_route_names_as_operation_ids(current_app: FastAPI):
             route.operation_id = route.name
 use_route_names_as_operation_ids(app)
 
+@app.on_event("startup")
+async def configure_threadpool():
+    # Sync endpoints and dependencies run on anyio's shared limiter (40 threads by default);
+    # size it to the DB pool so requests queue on threads rather than on pool_timeout
+    to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+    logger.info("APP_INIT: Threadpool for sync endpoints set to %d threads.", API_THREADPOOL_SIZE)
+
 @app.on_event("startup")
 def on_app_init_startup():
     # VERY FIRST LINES for unconditional logging:
@@ -107,8 +115,8 @@ def on_app_init_startup():
         else:
             logger.info("APP_INIT_STARTUP_EVENT: Scheduler was already running.")
 
-        # Register bandwidth monitoring job
-        from app.utils.system import record_realtime_bandwidth
+        # Register bandwidth and CPU sampling jobs
+        from app.utils.system import record_cpu_percent, record_realtime_bandwidth
         scheduler.add_job(
             record_realtime_bandwidth,
             "interval",
@@ -117,6 +125,14 @@ def on_app_init_startup():
             max_instances=1,
             id="realtime_bandwidth"
         )
+        scheduler.add_job(
+            record_cpu_percent,
+            "interval",
+            seconds=2,
+            coalesce=True,
+            max_instances=1,
+            id="cpu_percent"
+        )
 
         # Start telegram bot if configured
         from app.telegram import start_bot
@@ -134,6 +150,10 @@ def on_app_init_startup():
         xray_core_jobs.start_core()
 
         init_db()
+
+        # Load the JWT secret up front; token helpers then read it from a module global
+        from app.utils.jwt import get_secret_key
+        get_secret_key()
     except Exception as e_init_startup:
         logger.error(f"APP_INIT_STARTUP_EVENT: EXCEPTION: {e_init_startup}", exc_info=True)
 
@@ -4,11 +4,11 @@ Functions for managing proxy hosts, users, user templates, nodes, and administra
 
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, Union
 import logging
 
-from sqlalchemy import and_, delete, func, or_, select  # Add select here
-from sqlalchemy.orm import Query, Session, joinedload
+from sqlalchemy import and_, delete, func, or_, select, true  # Add select here
+from sqlalchemy.orm import Query, Session, joinedload, raiseload, selectinload
 from sqlalchemy.sql.functions import coalesce
 from app.db.models import Plan  # Changed from app.models.plan import Plan
 
@@ -41,24 +41,30 @@ from app.models.user import (
     UserUsageResponse
 )
 
-from config import  USERS_AUTODELETE_DAYS
+from config import RAISE_ON_LAZY_LOAD, USERS_AUTODELETE_DAYS
 
 
 logger = logging.getLogger("marzban")
 
-# Set logging level to DEBUG
-logger.setLevel(logging.DEBUG)
-
 
 def get_user_queryset(db: Session) -> Query:
+    # joinedload for scalar relations, selectinload for collections so a page of users
+    # neither multiplies rows (proxies x usage_logs) nor lazy-loads per user
     return db.query(DBUser).options(
         joinedload(DBUser.next_plan),
-        joinedload(DBUser.proxies),
-        joinedload(DBUser.usage_logs),
-        joinedload(DBUser.active_node) # Eager load the active_node
+        joinedload(DBUser.active_node), # Eager load the active_node
+        selectinload(DBUser.proxies),
+        selectinload(DBUser.usage_logs),
     )
 
 
+def guard_lazy_loads(query: Query) -> Query:
+    """Make relationships that were not eager-loaded raise on access when RAISE_ON_LAZY_LOAD is set."""
+    if RAISE_ON_LAZY_LOAD:
+        return query.options(raiseload("*"))
+    return query
+
+
 def get_user(db: Session, account_number: str) -> Optional[DBUser]:
     account_number_to_query = account_number.lower()
     return get_user_queryset(db).filter(DBUser.account_number == account_number_to_query).first()
@@ -86,27 +92,22 @@ class UsersSortingOptionsEnum(Enum): # Changed to class for better type hinting
 
     @classmethod
     def from_string(cls, s: str) -> Optional['UsersSortingOptionsEnum']:
-        try:
-            if s.startswith("-"):
-                return cls[s[1:] + "_desc"]
-            else:
-                return cls[s + "_asc"]
-        except KeyError:
-            return None
+        return USERS_SORT_LOOKUP.get(s)
 
 
-def get_users(db: Session,
-              offset: Optional[int] = None,
-              limit: Optional[int] = None,
-              account_numbers: Optional[List[str]] = None,
-              search: Optional[str] = None,
-              status: Optional[Union[UserStatus, list]] = None,
-              sort: Optional[List[UsersSortingOptionsEnum]] = None, # Use the class
-              admins: Optional[List[str]] = None, # List of admin usernames for filtering
-              reset_strategy: Optional[Union[UserDataLimitResetStrategy, list]] = None,
-              return_with_count: bool = False) -> Union[List[DBUser], Tuple[List[DBUser], int]]:
-    query = get_user_queryset(db)
+# "field" -> ascending, "-field" -> descending; built once instead of per sort token
+USERS_SORT_LOOKUP: Dict[str, UsersSortingOptionsEnum] = {
+    **{name[:-len("_asc")]: opt for name, opt in UsersSortingOptionsEnum.__members__.items() if name.endswith("_asc")},
+    **{"-" + name[:-len("_desc")]: opt for name, opt in UsersSortingOptionsEnum.__members__.items() if name.endswith("_desc")},
+}
+
 
+def filter_users_query(query: Query,
+                       account_numbers: Optional[List[str]] = None,
+                       search: Optional[str] = None,
+                       status: Optional[Union[UserStatus, list]] = None,
+                       admins: Optional[List[str]] = None,
+                       reset_strategy: Optional[Union[UserDataLimitResetStrategy, list]] = None) -> Query:
     if account_numbers:
         lowercase_account_numbers = [acc_num.lower() for acc_num in account_numbers]
         query = query.filter(DBUser.account_number.in_(lowercase_account_numbers))
@@ -135,6 +136,29 @@ def get_users(db: Session,
     if admins:
         query = query.join(DBUser.admin).filter(Admin.username.in_(admins))
 
+    return query
+
+
+def get_users(db: Session,
+              offset: Optional[int] = None,
+              limit: Optional[int] = None,
+              account_numbers: Optional[List[str]] = None,
+              search: Optional[str] = None,
+              status: Optional[Union[UserStatus, list]] = None,
+              sort: Optional[List[UsersSortingOptionsEnum]] = None, # Use the class
+              admins: Optional[List[str]] = None, # List of admin usernames for filtering
+              reset_strategy: Optional[Union[UserDataLimitResetStrategy, list]] = None,
+              return_with_count: bool = False,
+              count_strategy: Literal["always", "if_needed"] = "if_needed") -> Union[List[DBUser], Tuple[List[DBUser], int]]:
+    query = filter_users_query(
+        guard_lazy_loads(get_user_queryset(db)),
+        account_numbers=account_numbers,
+        search=search,
+        status=status,
+        admins=admins,
+        reset_strategy=reset_strategy,
+    )
+
     count_query = query.with_session(db) # Create a new query for count based on current filters
 
     if sort:
@@ -162,13 +186,27 @@ def get_users(db: Session,
         query = query.limit(limit)
 
     if return_with_count:
+        users = query.all()
+        # An unpaginated or short first page already holds every matching row, so COUNT(*) is redundant
+        if count_strategy == "if_needed" and not offset and (limit is None or len(users) < limit):
+            return users, len(users)
         # For an accurate count with joins and potential duplicates before distinct User.id
         total_count = count_query.distinct(DBUser.id).count()
-        return query.all(), total_count
+        return users, total_count
 
     return query.all()
 
 
+def iter_users(db: Session,
+               search: Optional[str] = None,
+               status: Optional[Union[UserStatus, list]] = None,
+               admins: Optional[List[str]] = None,
+               batch_size: int = 500) -> Iterator[DBUser]:
+    """Yield matching users in id order, fetching batch_size rows at a time."""
+    query = filter_users_query(get_user_queryset(db), search=search, status=status, admins=admins)
+    return iter(query.order_by(DBUser.id).yield_per(batch_size))
+
+
 def get_user_usages(db: Session, dbuser: DBUser, start: datetime, end: datetime) -> List[UserUsageResponse]:
     usages: Dict[Union[int, None], UserUsageResponse] = {
         None: UserUsageResponse( # Use None as key for Master/Core
@@ -272,6 +310,38 @@ def remove_users(db: Session, dbusers: List[DBUser]):
     db.commit()
 
 
+def remove_users_returning(db: Session, user_ids: List[int]) -> List[Tuple[str, Optional[int]]]:
+    """
+    Delete users and their dependent rows with set-based statements.
+
+    Mirrors the ORM cascades of remove_users without loading each user, and returns
+    (account_number, active_node_id) for every deleted row.
+    """
+    if not user_ids:
+        return []
+
+    db.query(Proxy).filter(Proxy.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(NodeUserUsage).filter(NodeUserUsage.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(NotificationReminder).filter(NotificationReminder.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(NextPlan).filter(NextPlan.user_id.in_(user_ids)).delete(synchronize_session=False)
+    # usage_logs has no delete cascade; the ORM detaches them, so do the same
+    db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id.in_(user_ids)).update(
+        {UserUsageResetLogs.user_id: None}, synchronize_session=False
+    )
+
+    stmt = delete(DBUser).where(DBUser.id.in_(user_ids))
+    if db.get_bind().dialect.delete_returning:
+        removed = db.execute(
+            stmt.returning(DBUser.account_number, DBUser.active_node_id),
+            execution_options={"synchronize_session": False},
+        ).all()
+    else:  # MySQL has no DELETE ... RETURNING
+        removed = db.query(DBUser.account_number, DBUser.active_node_id).filter(DBUser.id.in_(user_ids)).all()
+        db.execute(stmt, execution_options={"synchronize_session": False})
+    db.commit()
+    return [tuple(row) for row in removed]
+
+
 def update_user(db: Session, dbuser: DBUser, modify: UserModify) -> DBUser:
     print(f"[DEBUG] update_user: Starting update for user {dbuser.account_number}")
     print(f"[DEBUG] update_user: Current user state: {dbuser.__dict__}")
@@ -452,23 +522,36 @@ def update_user_sub(db: Session, dbuser: DBUser, user_agent: str) -> DBUser:
     return dbuser
 
 
-def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
-    query = get_user_queryset(db) # Use queryset for potential eager loads if status logic becomes complex
-    if admin:
-        query = query.join(DBUser.admin).filter(Admin.id == admin.id) # Correctly filter by Admin object
-
-    for user_item in query.all(): # Renamed var
-        user_item.used_traffic = 0
-        db.query(NodeUserUsage).filter(NodeUserUsage.user_id == user_item.id).delete(synchronize_session=False)
-        if user_item.status not in [UserStatus.on_hold, UserStatus.expired, UserStatus.disabled]:
-            user_item.status = UserStatus.active
-            user_item.last_status_change = datetime.utcnow() # Update if status changed
-        if user_item.next_plan:
-            db.delete(user_item.next_plan)
-            user_item.next_plan = None
+def reset_all_users_data_usage(db: Session):
+    # Set-based statements: each table is touched once instead of once per user row
+    users_query = db.query(DBUser)
+    user_ids = users_query.with_entities(DBUser.id).scalar_subquery()
+
+    db.query(NodeUserUsage).filter(NodeUserUsage.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(NextPlan).filter(NextPlan.user_id.in_(user_ids)).delete(synchronize_session=False)
+    users_query.update({DBUser.used_traffic: 0}, synchronize_session=False)
+    users_query.filter(
+        DBUser.status.notin_([UserStatus.on_hold, UserStatus.expired, UserStatus.disabled])
+    ).update(
+        {DBUser.status: UserStatus.active, DBUser.last_status_change: datetime.utcnow()},
+        synchronize_session=False
+    )
     db.commit()
 
 
+def get_node_assigned_users(db: Session,
+                            statuses: List[UserStatus],
+                            exclude: bool = False) -> List[Tuple[str, int]]:
+    """(account_number, active_node_id) of users on a node whose status is (or with exclude, is not) in statuses."""
+    status_filter = DBUser.status.notin_(statuses) if exclude else DBUser.status.in_(statuses)
+    return [
+        tuple(row) for row in db.execute(
+            select(DBUser.account_number, DBUser.active_node_id)
+            .where(DBUser.active_node_id.isnot(None), status_filter)
+        )
+    ]
+
+
 def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
     query = db.query(DBUser).filter(DBUser.status.in_([UserStatus.active, UserStatus.on_hold]))
     if admin:
@@ -550,7 +633,7 @@ def get_all_users_usages(
         user_ids_subquery = db.query(DBUser.id).filter(DBUser.admin_id.in_(admin_ids_subquery)).subquery()
         usage_query_conditions.append(NodeUserUsage.user_id.in_(user_ids_subquery)) # type: ignore
 
-    for v_usage in db.query(NodeUserUsage).filter(and_(*usage_query_conditions)): # Renamed var
+    for v_usage in guard_lazy_loads(db.query(NodeUserUsage)).filter(and_(*usage_query_conditions)): # Renamed var
         key_to_use = v_usage.node_id
         if key_to_use in usages:
             usages[key_to_use].used_traffic += v_usage.used_traffic
@@ -1199,14 +1282,15 @@ def get_certificate_authority(db: Session):
     return db.query(CertificateAuthority).first()
 
 
-def create_or_update_certificate_authority(db: Session, cert_info) -> None:
-    """Create or update the CA certificate in database."""
+def create_or_update_certificate_authority(db: Session, cert_info, commit: bool = True) -> None:
+    """Create or update the CA certificate in database; commit=False leaves it to the caller's transaction."""
     from app.db.models import CertificateAuthority
 
     # Remove existing CA if any
     existing_ca = db.query(CertificateAuthority).first()
     if existing_ca:
         db.delete(existing_ca)
+        db.flush()  # unit of work orders INSERTs before DELETEs; the old row must go first
 
     # Create new CA record
     ca_record = CertificateAuthority(
@@ -1221,7 +1305,8 @@ def create_or_update_certificate_authority(db: Session, cert_info) -> None:
     )
 
     db.add(ca_record)
-    db.commit()
+    if commit:
+        db.commit()
 
 
 def get_node_certificate(db: Session, node_name: str):
@@ -1230,14 +1315,55 @@ def get_node_certificate(db: Session, node_name: str):
     return db.query(NodeCertificate).filter(NodeCertificate.node_name == node_name).first()
 
 
-def create_or_update_node_certificate(db: Session, node_name: str, server_cert, panel_client_cert):
-    """Create or update node certificates in database."""
+def get_node_certificate_with_ca(db: Session, node_name: str):
+    """Get (NodeCertificate, CertificateAuthority or None) in one query; None if the node has no certificates."""
+    from app.db.models import CertificateAuthority, NodeCertificate
+    # There is at most one CA row, so the unconditional outer join adds no duplicates
+    return db.query(NodeCertificate, CertificateAuthority).outerjoin(CertificateAuthority, true()).filter(
+        NodeCertificate.node_name == node_name
+    ).first()
+
+
+def get_node_certificate_with_ca_public(db: Session, node_name: str):
+    """Like get_node_certificate_with_ca, but only the CA's public columns; its private key is never loaded."""
+    from app.db.models import CertificateAuthority, NodeCertificate
+    return db.query(
+        NodeCertificate,
+        CertificateAuthority.certificate_pem,
+        CertificateAuthority.subject_name,
+        CertificateAuthority.issuer_name,
+        CertificateAuthority.serial_number,
+        CertificateAuthority.valid_from,
+        CertificateAuthority.valid_until,
+    ).outerjoin(CertificateAuthority, true()).filter(
+        NodeCertificate.node_name == node_name
+    ).first()
+
+
+def get_node_certificate_pems(db: Session, node_names: Optional[List[str]] = None):
+    """(node_name, server cert, server key, panel client cert, panel client key) PEM rows; all nodes when node_names is None."""
+    from app.db.models import NodeCertificate
+    query = db.query(
+        NodeCertificate.node_name,
+        NodeCertificate.server_certificate_pem,
+        NodeCertificate.server_private_key_pem,
+        NodeCertificate.panel_client_certificate_pem,
+        NodeCertificate.panel_client_private_key_pem,
+    )
+    if node_names is not None:
+        query = query.filter(NodeCertificate.node_name.in_(node_names))
+    return query.all()
+
+
+def create_or_update_node_certificate(db: Session, node_name: str, server_cert, panel_client_cert, commit: bool = True):
+    """Create or update node certificates in database; commit=False leaves it to the caller's transaction."""
     from app.db.models import NodeCertificate
 
     # Remove existing certificates for this node
     existing_cert = db.query(NodeCertificate).filter(NodeCertificate.node_name == node_name).first()
     if existing_cert:
         db.delete(existing_cert)
+        db.flush()  # unit of work orders INSERTs before DELETEs; the old row must go first
 
     # Create new certificate record
     cert_record = NodeCertificate(
@@ -1257,7 +1383,8 @@ def create_or_update_node_certificate(db: Session, node_name: str, server_cert,
     )
 
     db.add(cert_record)
-    db.commit()
+    if commit:
+        db.commit()
 
 
 def get_node_by_name(db: Session, node_name: str):
@@ -85,7 +85,7 @@ class User(Base):
     edit_at = Column(DateTime, nullable=True, default=None)
     last_status_change = Column(DateTime, default=datetime.utcnow, nullable=True)
     active_node_id = Column(Integer, ForeignKey("nodes.id", name="fk_user_active_node"), nullable=True, index=True)
-    active_node = relationship("Node", foreign_keys=[active_node_id], backref="active_users")
+    active_node = relationship("Node", foreign_keys=[active_node_id], back_populates="active_users")
 
     next_plan = relationship(
         "NextPlan",
@@ -238,6 +238,7 @@ class Node(Base):
     panel_client_key_pem = Column(String, nullable=True)
 
     # Relationships
+    active_users = relationship("User", foreign_keys="User.active_node_id", back_populates="active_node")
     user_usages = relationship("NodeUserUsage", back_populates="node", cascade="all, delete-orphan")
     usages = relationship("NodeUsage", back_populates="node", cascade="all, delete-orphan")
     service_configurations = relationship(
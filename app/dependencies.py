@@ -1,9 +1,10 @@
+from functools import lru_cache
 from typing import Optional, Union
 from app.models.admin import AdminInDB, AdminValidationResult, Admin
 from app.models.user import UserResponse, UserStatus # UserStatus might not be needed here directly
 from app.db import Session, crud, get_db
 from config import SUDOERS, SECRET_KEY, ALGORITHM # Ensure SECRET_KEY, ALGORITHM are in config
-from fastapi import Depends, HTTPException, status # Added status
+from fastapi import Depends, HTTPException, Request, status # Added status
 from datetime import datetime, timezone, timedelta
 from fastapi.security import OAuth2PasswordBearer
 from app.utils.jwt import get_subscription_payload # SECRET_KEY, ALGORITHM removed from here if now direct
@@ -36,6 +37,11 @@ def get_admin_by_username(username: str, db: Session = Depends(get_db)):
     return dbadmin
 
 
+def get_current_admin_orm(request: Request, admin: Admin = Depends(Admin.get_current)):
+    """ORM row of the current admin, reusing the one Admin.get_current loaded for this request."""
+    return request.state.admin_orm
+
+
 def get_dbnode(node_id: int, db: Session = Depends(get_db)):
     """Fetch a node by its ID from the database, raising a 404 error if not found."""
     dbnode = crud.get_node_by_id(db, node_id)
@@ -44,16 +50,22 @@ def get_dbnode(node_id: int, db: Session = Depends(get_db)):
     return dbnode
 
 
+@lru_cache(maxsize=4096)
+def parse_iso_datetime(value: str) -> datetime:
+    """Parse an ISO 8601 string to an aware UTC datetime; dashboards repeat the same ranges."""
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
 def validate_dates(start: Optional[Union[str, datetime]], end: Optional[Union[str, datetime]]) -> tuple[datetime, datetime]:
     """Validate if start and end dates are correct and if end is after start."""
     try:
+        # Only explicit strings are cached; the "now"-relative defaults must stay fresh
         if start:
-            start_date = start if isinstance(start, datetime) else datetime.fromisoformat(
-                start).astimezone(timezone.utc)
+            start_date = start if isinstance(start, datetime) else parse_iso_datetime(start)
         else:
             start_date = datetime.now(timezone.utc) - timedelta(days=30)
         if end:
-            end_date = end if isinstance(end, datetime) else datetime.fromisoformat(end).astimezone(timezone.utc)
+            end_date = end if isinstance(end, datetime) else parse_iso_datetime(end)
             if start_date and end_date < start_date: # start_date will always exist here
                 raise HTTPException(status_code=400, detail="Start date must be before end date")
         else:
@@ -156,10 +168,13 @@ def get_expired_users_list(db: Session, admin: Admin, expired_after: Optional[da
     if not admin.is_sudo and not dbadmin_orm: # Should not happen if admin is validated by Admin.get_current
          raise HTTPException(status_code=403, detail="Admin performing action not found")
 
+    # Users carry no owning-admin column, so a non-sudo admin owns none of them
+    if not admin.is_sudo:
+        return []
+
     dbusers_orm_list = crud.get_users(
         db=db,
         status=[UserStatus.expired, UserStatus.limited],
-        admin=dbadmin_orm if not admin.is_sudo else None # Pass the ORM admin model
     )
 
     return [
@@ -141,6 +141,27 @@ def report_user_deletion(username: str, by: str, admin: Admin = None):
         admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None
         )
 
+def report_users_deletion(usernames: list, by: str, admin: Admin = None):
+    for i in range(0, len(usernames), 50):
+        chunk = usernames[i:i + 50]
+        usersDeletion = {
+            'content': '',
+            'embeds': [
+                {
+                    'title': f':wastebasket: Deleted ({len(chunk)})',
+                    'description': '\n'.join(f'**Username: **{u}' for u in chunk),
+                    "footer": {
+                        "text": f"Belongs To: {admin.username if admin else None}\nBy: {by}"
+                    },
+                    'color': int("ff0000", 16)
+                }
+            ]
+        }
+        send_webhooks(
+            json_data=usersDeletion,
+            admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None
+            )
+
 def report_user_usage_reset(username: str, by: str, admin: Admin = None):
     userUsageReset = {
         'content': '',
@@ -1,7 +1,7 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 import logging
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from pydantic import BaseModel, ConfigDict, field_validator
@@ -10,6 +10,9 @@ from app.db import Session, crud, get_db
 from app.utils.jwt import get_admin_payload
 from config import SUDOERS
 
+if TYPE_CHECKING:
+    from app.db.models import Admin as DBAdmin
+
 logger = logging.getLogger("marzban")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/admin/token")  # Admin view url
@@ -39,7 +42,7 @@ class Admin(BaseModel):
         raise ValueError("must be an integer or a float, not a string")  # Reject strings
 
     @classmethod
-    def get_admin(cls, token: str, db: Session) -> Optional["Admin"]: # Return type is Pydantic Admin
+    def get_admin_orm(cls, token: str, db: Session) -> Optional["DBAdmin"]:
         payload = get_admin_payload(token)
         if not payload:
             logger.warning("get_admin_payload returned None")
@@ -68,49 +71,65 @@ class Admin(BaseModel):
                 logger.warning(f"Token missing created_at claim for admin: {username_from_token}")
                 return None
 
+        return db_admin_orm
+
+    @classmethod
+    def from_db_admin(cls, db_admin_orm: "DBAdmin") -> "Admin":
         # Create Pydantic model from the ORM model fetched from the database
         pydantic_admin_instance = cls.model_validate(db_admin_orm)
 
         # Now, if the username is in SUDOERS, ensure their is_sudo status is True
-        if username_from_token in SUDOERS:
+        if db_admin_orm.username in SUDOERS:
             pydantic_admin_instance.is_sudo = True
         return pydantic_admin_instance
 
+    @classmethod
+    def get_admin(cls, token: str, db: Session) -> Optional["Admin"]: # Return type is Pydantic Admin
+        db_admin_orm = cls.get_admin_orm(token, db)
+        return cls.from_db_admin(db_admin_orm) if db_admin_orm else None
+
     @classmethod
     def get_current(cls,
+                    request: Request,
                     db: Session = Depends(get_db),
                     token: str = Depends(oauth2_scheme)):
         logger.debug("Validating current admin token")
-        admin = cls.get_admin(token, db)
-        if not admin:
+        db_admin_orm = cls.get_admin_orm(token, db)
+        if not db_admin_orm:
             logger.warning("Failed to validate current admin token")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        # Kept for get_current_admin_orm so endpoints don't fetch the same row again
+        request.state.admin_orm = db_admin_orm
+        admin = cls.from_db_admin(db_admin_orm)
         logger.debug(f"Successfully validated current admin: {admin.username}")
         return admin
 
     @classmethod
     def check_sudo_admin(cls,
+                         request: Request,
                          db: Session = Depends(get_db),
                          token: str = Depends(oauth2_scheme)):
         logger.debug("Validating sudo admin token")
-        admin = cls.get_admin(token, db)
-        if not admin:
+        db_admin_orm = cls.get_admin_orm(token, db)
+        if not db_admin_orm:
             logger.warning("Failed to validate sudo admin token")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        admin = cls.from_db_admin(db_admin_orm)
         if not admin.is_sudo:
             logger.warning(f"Non-sudo admin {admin.username} attempted sudo operation")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="You're not allowed"
             )
+        request.state.admin_orm = db_admin_orm
         logger.debug(f"Successfully validated sudo admin: {admin.username}")
         return admin
 
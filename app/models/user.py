@@ -127,7 +127,7 @@ class User(BaseModel):
 
 
 class UserCreate(User):
-    account_number: Optional[str] = Field(None, description="Account number (UUID), auto-generated if not provided")
+    account_number: Optional[str] = Field(None, description="Account number (UUID), auto-generated as 32 lowercase hex characters if not provided")
     status: UserStatusCreate = UserStatusCreate.disabled
     # REMOVED: inbounds: Optional[Dict[str, List[str]]] = Field(default_factory=dict)
 
@@ -267,8 +267,16 @@ class UserResponse(User):
         # Generate V2Ray links if node is active and proxies exist
         if self.active_node_id and self.proxies:
             try:
-                from app.subscription.share import generate_v2ray_links  # Local import
-                node_services = crud.get_services_for_node(db, self.active_node_id)
+                from app.subscription.share import generate_v2ray_links, user_format_variables  # Local import
+                # Callers validating many users pass a shared 'node_services' dict so each node is queried once
+                node_services_cache = info.context.get('node_services')
+                if node_services_cache is None:
+                    node_services = crud.get_services_for_node(db, self.active_node_id)
+                elif self.active_node_id in node_services_cache:
+                    node_services = node_services_cache[self.active_node_id]
+                else:
+                    node_services = crud.get_services_for_node(db, self.active_node_id)
+                    node_services_cache[self.active_node_id] = node_services
                 active_node_specific_inbounds = {}
 
                 for proxy_type_enum, user_proxy_settings in self.proxies.items():
@@ -287,7 +295,8 @@ class UserResponse(User):
                     self.links = generate_v2ray_links(
                         proxies=self.proxies,
                         inbounds=active_node_specific_inbounds,
-                        extra_data=self.model_dump(exclude_none=True), # Use exclude_none
+                        extra_data=None,
+                        format_variables=user_format_variables(self),
                         reverse=False,
                         active_node_id=self.active_node_id
                     )
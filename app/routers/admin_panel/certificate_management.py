@@ -139,7 +139,7 @@ def get_node_certificates(
 ):
     """Get certificate information for a specific node"""
     cert_manager = CertificateManager(db)
-    node_certs = cert_manager.get_node_certificates(node_name)
+    node_certs = cert_manager.get_node_certificates_lite(node_name)
     
     if not node_certs:
         raise HTTPException(status_code=404, detail=f"No certificates found for node: {node_name}")
@@ -257,7 +257,7 @@ def download_certificate_file(
         )
     
     cert_manager = CertificateManager(db)
-    node_certs = cert_manager.get_node_certificates(node_name)
+    node_certs = cert_manager.get_node_certificates_lite(node_name)
     
     if not node_certs:
         raise HTTPException(status_code=404, detail=f"No certificates found for node: {node_name}")
@@ -324,14 +324,12 @@ def _regenerate_all_node_certificates(db: Session):
     try:
         cert_manager = CertificateManager(db)
         nodes = get_nodes(db)  # Get all nodes
-        
-        for node in nodes:
-            try:
-                cert_manager.generate_node_certificates(node.name, node.address)
-                logger.info(f"Regenerated certificates for node: {node.name}")
-            except Exception as e:
-                logger.error(f"Failed to regenerate certificates for node {node.name}: {e}")
-                
+
+        # Leaf keys for the whole fleet are generated up front, in parallel for RSA
+        regenerated = cert_manager.generate_node_certificates_bulk([(node.name, node.address) for node in nodes])
+        for node_name in regenerated:
+            logger.info(f"Regenerated certificates for node: {node_name}")
+
     except Exception as e:
         logger.error(f"Failed to regenerate all node certificates: {e}")
 
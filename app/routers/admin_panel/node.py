@@ -20,6 +20,7 @@ from app.models.node import (
     NodesUsageResponse,
 )
 from app.models.node import Node as DBNode
+from app.subscription.share import invalidate_node_details
 
 from app.utils import responses
 
@@ -211,6 +212,7 @@ def modify_node(
 ):
     """Update a node's details. Only accessible to sudo admins."""
     updated_node = crud.update_node(db, dbnode, modified_node)
+    invalidate_node_details(updated_node.id)
     xray.operations.remove_node(updated_node.id)
     if updated_node.status != NodeStatus.disabled:
         bg.add_task(xray.operations.connect_node, node_id=updated_node.id)
@@ -238,6 +240,7 @@ def remove_node(
 ):
     """Delete a node and remove it from xray in the background."""
     crud.remove_node(db, dbnode)
+    invalidate_node_details(dbnode.id)
     xray.operations.remove_node(dbnode.id)
 
     logging.getLogger("marzban").info(f'Node "{dbnode.name}" deleted')
@@ -13,6 +13,7 @@ from app.db.models import NodeServiceConfiguration
 from app.xray import xray  # This import should now work correctly
 from app.xray.node import XRayNode
 from app.xray import operations
+from app.subscription.share import invalidate_all_subscriptions
 import logging
 from config import XRAY_CONFIG_PATH
 # from app.dependencies import get_current_active_admin_user # Authentication
@@ -46,6 +47,7 @@ def create_service_for_node(
         db_service = crud.create_with_node(db, obj_in=service_in, node_id=node_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    invalidate_all_subscriptions()
 
     # Trigger node reconfiguration
     try:
@@ -125,6 +127,7 @@ def update_service_on_node(
     # TODO: Handle xray_inbound_tag updates carefully if it needs to remain unique per node.
 
     updated_service = crud.update(db, db_obj=db_service, obj_in=service_in)
+    invalidate_all_subscriptions()
 
     # TODO: Trigger node reconfiguration logic
     # xray_operations.reconfigure_node(db, node_id=node_id)
@@ -149,6 +152,7 @@ def delete_service_from_node(
         raise HTTPException(status_code=404, detail="Service not found or does not belong to this node")
 
     crud.remove(db, id=service_id)
+    invalidate_all_subscriptions()
 
     # TODO: Trigger node reconfiguration logic
     # xray_operations.reconfigure_node(db, node_id=node_id)
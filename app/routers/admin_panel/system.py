@@ -1,15 +1,17 @@
-from typing import Dict, List, Union
+from typing import Dict, List
 
 from fastapi import APIRouter, Depends, HTTPException
 
 from app import xray
 from app.version import __version__
 from app.db import Session, crud, get_db
+from app.dependencies import get_current_admin_orm
 from app.models.admin import Admin
 from app.db.models import NodeServiceConfiguration
 from app.models.node_service import NodeServiceConfigurationResponse
 from app.models.system import SystemStats
 from app.models.user import UserStatus
+from app.subscription.share import invalidate_all_subscriptions
 from app.utils import responses
 from app.utils.system import cpu_usage, memory_usage, realtime_bandwidth
 
@@ -18,13 +20,14 @@ router = APIRouter(tags=["System"], responses={401: responses._401})
 
 @router.get("/system", response_model=SystemStats)
 def get_system_stats(
-    db: Session = Depends(get_db), admin: Admin = Depends(Admin.get_current)
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(Admin.get_current),
+    dbadmin=Depends(get_current_admin_orm),
 ):
     """Fetch system stats including memory, CPU, and user metrics."""
     mem = memory_usage()
     cpu = cpu_usage()
     system = crud.get_system_usage(db)
-    dbadmin: Union[Admin, None] = crud.get_admin(db, admin.username)
 
     total_user = crud.get_users_count(db, admin=dbadmin if not admin.is_sudo else None)
     users_active = crud.get_users_count(
@@ -131,6 +134,7 @@ def modify_default_template_config(
         xray.hosts.update()
     else:
         print("Warning: xray.hosts.update() not found or not callable. Host list may be stale.")
+    invalidate_all_subscriptions()
 
     return {
         "detail": "Default template config updated. Restart command issued to all connected nodes.",
@@ -1,14 +1,16 @@
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Union
 import uuid
 import logging
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 from app import xray
-from app.db import Session, crud, get_db
+from app.db import GetDB, Session, crud, get_db
 from app.db.models import User as DBUser
 from app.db.models import Admin as DBAdmin
 from app.dependencies import get_expired_users_list, get_validated_user, validate_dates
@@ -24,13 +26,26 @@ from app.models.user import (
 )
 from app.models.node import NodeResponse, NodeStatus
 from app.models.proxy import ProxyTypes
+from app.subscription.share import invalidate_all_subscriptions, invalidate_user_subscriptions
 from app.utils import report, responses
+from config import USERS_PAGE_DEFAULT_LIMIT
 
-# Set logging level to DEBUG
-logging.getLogger("marzban").setLevel(logging.DEBUG)
+logger = logging.getLogger("marzban")
 
 router = APIRouter(tags=["Users"], responses={401: responses._401})
 
+# Resolved once; ProxyTypes.settings_model is a chain of comparisons per access
+PROXY_DEFAULTS = {pt: pt.settings_model for pt in ProxyTypes if pt.settings_model is not None}
+
+# Validates a whole page in one pydantic-core call instead of one model_validate per user
+_USERS_ADAPTER = TypeAdapter(List[UserResponse])
+
+
+def json_response(content: str) -> Response:
+    # Pre-serialized bodies bypass FastAPI's response_model pass, which would dump and
+    # re-validate UserResponse (re-running build_dynamic_fields) on every return
+    return Response(content=content, media_type="application/json")
+
 
 @router.post("", response_model=UserResponse, responses={400: responses._400, 409: responses._409})
 def add_user(
@@ -38,63 +53,44 @@ def add_user(
     db: Session = Depends(get_db),
     current_admin: PydanticAdmin = Depends(PydanticAdmin.get_current),
 ):
-    generated_account_number = new_user.account_number if new_user.account_number else str(uuid.uuid4())
-    generated_account_number = generated_account_number.lower()
+    # uuid4().hex is already lowercase and skips str(UUID)'s dash formatting
+    generated_account_number = new_user.account_number.lower() if new_user.account_number else uuid.uuid4().hex
 
     # Default proxy configurations logic
-    logging.getLogger("marzban").info(f"POST /api/admin/users: Initializing default proxy configurations for new user '{generated_account_number}'.")
-    default_proxy_configurations_to_ensure = {}
+    logger.debug("POST /api/admin/users: Initializing default proxy configurations for new user '%s'.", generated_account_number)
     if new_user.proxies is None:
         new_user.proxies = {}
 
-    logging.getLogger("marzban").debug(f"Current xray.config.inbounds_by_protocol: {xray.config.inbounds_by_protocol}")
-    for pt_enum_member in ProxyTypes:
-        logging.getLogger("marzban").debug(f"Checking default proxy for {pt_enum_member.value}")
-        if xray.config.inbounds_by_protocol.get(pt_enum_member.value):
-            settings_model_class = pt_enum_member.settings_model
-            if settings_model_class:
-                if pt_enum_member not in new_user.proxies:
-                    logging.getLogger("marzban").debug(f"Protocol '{pt_enum_member.value}' is enabled. Adding its default settings for user '{generated_account_number}'.")
-                    default_proxy_configurations_to_ensure[pt_enum_member] = settings_model_class()
-            else:
-                logging.getLogger("marzban").warning(f"Protocol '{pt_enum_member.value}' is enabled but has no associated settings_model.")
-        else:
-            logging.getLogger("marzban").info(f"Protocol '{pt_enum_member.value}' is not configured/disabled. Skipping default for '{generated_account_number}'.")
-
-    for proxy_type_enum, default_settings_instance in default_proxy_configurations_to_ensure.items():
-        new_user.proxies[proxy_type_enum] = default_settings_instance
+    # Snapshot once; used by both the default-fill loop and the validation below
+    enabled_protocols = xray.config.enabled_protocols
+    logger.debug("Currently enabled protocols: %s", enabled_protocols)
+    for pt_enum_member, settings_model_class in PROXY_DEFAULTS.items():
+        if pt_enum_member.value in enabled_protocols and pt_enum_member not in new_user.proxies:
+            # model_construct runs the default factories (fresh UUID/password per user) but skips
+            # validation; a shared template copied with model_copy would hand every user the same secret
+            new_user.proxies[pt_enum_member] = settings_model_class.model_construct()
 
     # Protocol Validation
-    logging.getLogger("marzban").debug(f"POST /api/admin/users: Validating final proxy set for user '{generated_account_number}'.")
+    logger.debug("POST /api/admin/users: Validating final proxy set for user '%s'.", generated_account_number)
     if new_user.proxies:
-        proxies_to_check = list(new_user.proxies.keys())
-        for proxy_type_enum_value in proxies_to_check:
-            proxy_type_enum = ProxyTypes(proxy_type_enum_value)
-            if not xray.config.inbounds_by_protocol.get(proxy_type_enum.value):
-                logging.getLogger("marzban").warning(f"POST /api/admin/users: Validation failed for '{generated_account_number}' - Protocol '{proxy_type_enum.value}' is disabled. Raising 400.")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Protocol {proxy_type_enum.value} is disabled on your server or has no defined inbounds.",
-                )
-
-    logging.getLogger("marzban").info(f"POST /api/admin/users: Fetching admin '{current_admin.username}' for ownership.")
-    db_admin_orm = crud.get_admin(db, current_admin.username)
-    if not db_admin_orm:
-        logging.getLogger("marzban").error(f"POST /api/admin/users: CRITICAL - Admin '{current_admin.username}' NOT FOUND. Raising 403.")
-        raise HTTPException(status_code=403, detail="Performing admin not found in database.")
+        disabled_protocols = sorted(ProxyTypes(pt).value for pt in new_user.proxies.keys() - enabled_protocols)
+        if disabled_protocols:
+            logger.warning("POST /api/admin/users: Validation failed for '%s' - Protocols %s are disabled. Raising 400.", generated_account_number, disabled_protocols)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Protocols disabled on your server or with no defined inbounds: {', '.join(disabled_protocols)}",
+            )
 
     try:
-        logging.getLogger("marzban").info(f"POST /api/admin/users: Calling crud.create_user for '{generated_account_number}'.")
-        db_user_orm = crud.create_user(
-            db, account_number=generated_account_number, user=new_user, admin=db_admin_orm
-        )
-        logging.getLogger("marzban").info(f"POST /api/admin/users: crud.create_user successful for '{generated_account_number}', New User ID: {db_user_orm.id}.")
+        logger.debug("POST /api/admin/users: Calling crud.create_user for '%s'.", generated_account_number)
+        db_user_orm = crud.create_user(db, account_number=generated_account_number, user=new_user)
+        logger.debug("POST /api/admin/users: crud.create_user successful for '%s', New User ID: %s.", generated_account_number, db_user_orm.id)
     except IntegrityError:
-        logging.getLogger("marzban").error(f"POST /api/admin/users: IntegrityError for '{generated_account_number}'.", exc_info=True)
+        logger.error("POST /api/admin/users: IntegrityError for '%s'.", generated_account_number, exc_info=True)
         db.rollback()
         raise HTTPException(status_code=409, detail="User with this account number or details already exists")
     except Exception as e:
-        logging.getLogger("marzban").error(f"POST /api/admin/users: Unexpected error during crud.create_user for '{generated_account_number}': {e}", exc_info=True)
+        logger.error("POST /api/admin/users: Unexpected error during crud.create_user for '%s': %s", generated_account_number, e, exc_info=True)
         db.rollback()
         raise HTTPException(status_code=500, detail="An unexpected error occurred while creating the user.")
 
@@ -105,8 +101,28 @@ def add_user(
         by=current_admin,
         user_admin=db_user_orm.admin
     )
-    logging.getLogger("marzban").info(f'New user with account number "{db_user_orm.account_number}" added to DB. No XRay activation yet.')
-    return user_response
+    invalidate_user_subscriptions(db_user_orm.account_number)
+    logger.info('New user with account number "%s" added to DB. No XRay activation yet.', db_user_orm.account_number)
+    return json_response(user_response.model_dump_json())
+
+
+@router.get("/export", response_model=List[UserResponse])
+def export_users(
+    search: Optional[str] = None,
+    status: Optional[UserStatus] = None,
+    current_admin: PydanticAdmin = Depends(PydanticAdmin.get_current),
+):
+    def generate():
+        # Own session: the request-scoped one is closed once the endpoint returns
+        with GetDB() as db:
+            validation_context = {'db': db, 'node_services': {}}
+            yield "["
+            for i, db_user_orm in enumerate(crud.iter_users(db, search=search, status=status)):
+                user_json = UserResponse.model_validate(db_user_orm, context=validation_context).model_dump_json()
+                yield f",{user_json}" if i else user_json
+            yield "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 
 @router.get("/{account_number}", response_model=UserResponse, responses={403: responses._403, 404: responses._404})
@@ -123,18 +139,18 @@ def modify_user(
     current_admin: PydanticAdmin = Depends(PydanticAdmin.get_current),
 ):
     if modified_user.proxies:
-        for proxy_type_enum_value in modified_user.proxies:
-            proxy_type_enum = ProxyTypes(proxy_type_enum_value)
-            if not xray.config.inbounds_by_protocol.get(proxy_type_enum.value):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Protocol {proxy_type_enum.value} is disabled on your server",
-                )
+        disabled_protocols = sorted(ProxyTypes(pt).value for pt in modified_user.proxies.keys() - xray.config.enabled_protocols)
+        if disabled_protocols:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Protocols disabled on your server: {', '.join(disabled_protocols)}",
+            )
 
     old_status = db_user_orm.status
     dbuser_updated_orm = crud.update_user(db, db_user_orm, modified_user)
     user_response_for_bg_and_report = UserResponse.model_validate(dbuser_updated_orm, context={'db': db})
 
+    invalidate_user_subscriptions(dbuser_updated_orm.account_number)
     bg.add_task(xray.operations.update_user, user_id=dbuser_updated_orm.id)
 
     report.user_updated(
@@ -142,7 +158,7 @@ def modify_user(
         user_admin=dbuser_updated_orm.admin,
         by=current_admin
     )
-    logging.getLogger("marzban").info(f'User "{dbuser_updated_orm.account_number}" modified.')
+    logger.info('User "%s" modified.', dbuser_updated_orm.account_number)
 
     if dbuser_updated_orm.status != old_status:
         report.status_change(
@@ -152,10 +168,8 @@ def modify_user(
             user_admin=dbuser_updated_orm.admin,
             by=current_admin,
         )
-        logging.getLogger("marzban").info(
-            f'User "{dbuser_updated_orm.account_number}" status changed from {old_status.value} to {dbuser_updated_orm.status.value}'
-        )
-    return user_response_for_bg_and_report
+        logger.info('User "%s" status changed from %s to %s', dbuser_updated_orm.account_number, old_status.value, dbuser_updated_orm.status.value)
+    return json_response(user_response_for_bg_and_report.model_dump_json())
 
 
 @router.delete("/{account_number}", responses={403: responses._403, 404: responses._404})
@@ -170,19 +184,20 @@ def remove_user_endpoint(
     active_node_id_at_deletion = db_user_orm.active_node_id
 
     if active_node_id_at_deletion is not None:
-        logging.getLogger("marzban").info(f"User '{user_account_number}' is active on node {active_node_id_at_deletion}. Scheduling deactivation from XRay.")
+        logger.info("User '%s' is active on node %s. Scheduling deactivation from XRay.", user_account_number, active_node_id_at_deletion)
         bg.add_task(xray.operations.deactivate_user_from_active_node, account_number=user_account_number)
     else:
-        logging.getLogger("marzban").info(f"User '{user_account_number}' has no active node. No XRay deactivation needed.")
+        logger.info("User '%s' has no active node. No XRay deactivation needed.", user_account_number)
 
     crud.remove_user(db, db_user_orm)
+    invalidate_user_subscriptions(user_account_number)
 
     report.user_deleted(
         account_number=user_account_number,
         user_admin=user_admin_orm,
         by=current_admin
     )
-    logging.getLogger("marzban").info(f'User "{user_account_number}" deleted from DB.')
+    logger.info('User "%s" deleted from DB.', user_account_number)
     return {"detail": "User successfully deleted"}
 
 
@@ -196,26 +211,29 @@ def reset_user_data_usage(
     active_node_id_before_reset = db_user_orm.active_node_id
 
     dbuser_reset_orm = crud.reset_user_data_usage(db=db, dbuser=db_user_orm)
+    invalidate_user_subscriptions(dbuser_reset_orm.account_number)
     user_response_for_bg_and_report = UserResponse.model_validate(dbuser_reset_orm, context={'db': db})
 
     if active_node_id_before_reset is not None:
         if dbuser_reset_orm.status in [UserStatus.active, UserStatus.on_hold]:
-            logging.getLogger("marzban").info(f"User {dbuser_reset_orm.account_number} data reset, status {dbuser_reset_orm.status}. Re-activating on node {active_node_id_before_reset}.")
+            logger.info("User %s data reset, status %s. Re-activating on node %s.", dbuser_reset_orm.account_number, dbuser_reset_orm.status, active_node_id_before_reset)
             bg.add_task(xray.operations.activate_user_on_node,
                         account_number=dbuser_reset_orm.account_number,
                         node_id=active_node_id_before_reset)
         else:
-            logging.getLogger("marzban").info(f"User {dbuser_reset_orm.account_number} data reset, status {dbuser_reset_orm.status}. Deactivating from node {active_node_id_before_reset}.")
+            logger.info("User %s data reset, status %s. Deactivating from node %s.", dbuser_reset_orm.account_number, dbuser_reset_orm.status, active_node_id_before_reset)
             bg.add_task(xray.operations.deactivate_user_from_active_node,
                         account_number=dbuser_reset_orm.account_number)
 
-    report.user_data_usage_reset(
+    # Telegram/Discord delivery happens after the response is sent
+    bg.add_task(
+        report.user_data_usage_reset,
         user=user_response_for_bg_and_report,
         user_admin=dbuser_reset_orm.admin,
         by=current_admin
     )
-    logging.getLogger("marzban").info(f'User "{dbuser_reset_orm.account_number}"\'s usage was reset')
-    return user_response_for_bg_and_report
+    logger.info('User "%s"\'s usage was reset', dbuser_reset_orm.account_number)
+    return json_response(user_response_for_bg_and_report.model_dump_json())
 
 
 @router.post("/{account_number}/revoke_sub", response_model=UserResponse, responses={403: responses._403, 404: responses._404})
@@ -228,28 +246,30 @@ def revoke_user_subscription(
     active_node_id_before_revoke = db_user_orm.active_node_id
 
     dbuser_revoked_orm = crud.revoke_user_sub(db=db, dbuser=db_user_orm)
+    invalidate_user_subscriptions(dbuser_revoked_orm.account_number)
     user_response_for_bg_and_report = UserResponse.model_validate(dbuser_revoked_orm, context={'db': db})
 
     if active_node_id_before_revoke is not None:
         if dbuser_revoked_orm.status in [UserStatus.active, UserStatus.on_hold]:
-            logging.getLogger("marzban").info(f"User {dbuser_revoked_orm.account_number} subscription revoked. Re-activating on node {active_node_id_before_revoke} with new settings.")
+            logger.info("User %s subscription revoked. Re-activating on node %s with new settings.", dbuser_revoked_orm.account_number, active_node_id_before_revoke)
             bg.add_task(xray.operations.activate_user_on_node,
                         account_number=dbuser_revoked_orm.account_number,
                         node_id=active_node_id_before_revoke)
 
-    report.user_subscription_revoked(
+    bg.add_task(
+        report.user_subscription_revoked,
         user=user_response_for_bg_and_report,
         user_admin=dbuser_revoked_orm.admin,
         by=current_admin
     )
-    logging.getLogger("marzban").info(f'User "{dbuser_revoked_orm.account_number}" subscription revoked')
-    return user_response_for_bg_and_report
+    logger.info('User "%s" subscription revoked', dbuser_revoked_orm.account_number)
+    return json_response(user_response_for_bg_and_report.model_dump_json())
 
 
 @router.get("", response_model=UsersResponse, responses={400: responses._400, 403: responses._403, 404: responses._404})
 def get_users(
     offset: Optional[int] = None,
-    limit: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
     search: Optional[str] = None,
     status: Optional[UserStatus] = None,
     sort: Optional[str] = None,
@@ -259,23 +279,30 @@ def get_users(
     sort_options_list = []
     if sort:
         for opt_str in sort.strip(",").split(","):
-            enum_opt = crud.UsersSortingOptionsEnum.from_string(opt_str.strip())
-            if enum_opt:
-                sort_options_list.append(enum_opt)
-            else:
+            opt_str = opt_str.strip()
+            if not opt_str:
+                continue
+            enum_opt = crud.USERS_SORT_LOOKUP.get(opt_str)
+            if enum_opt is None:
                 raise HTTPException(status_code=400, detail=f'"{opt_str}" is not a valid sort option')
+            sort_options_list.append(enum_opt)
 
     users_orm_list, count = crud.get_users(
         db=db,
         offset=offset,
-        limit=limit,
+        limit=limit or USERS_PAGE_DEFAULT_LIMIT or None,
         search=search,
         status=status,
         sort=sort_options_list if sort_options_list else None,
         return_with_count=True,
     )
-    users_response_list = [UserResponse.model_validate(u_orm, context={'db': db}) for u_orm in users_orm_list]
-    return {"users": users_response_list, "total": count}
+    validation_context = {'db': db, 'node_services': {}}
+    users_response = UsersResponse(
+        users=_USERS_ADAPTER.validate_python(users_orm_list, from_attributes=True, context=validation_context),
+        total=count,
+    )
+    # Serialize once in pydantic-core; returning a Response skips FastAPI's response_model re-validation
+    return json_response(users_response.model_dump_json())
 
 
 @router.post("/reset", responses={403: responses._403, 404: responses._404})
@@ -284,31 +311,28 @@ def reset_all_users_data_usage(
     db: Session = Depends(get_db),
     current_admin: PydanticAdmin = Depends(PydanticAdmin.check_sudo_admin)
 ):
-    db_admin_orm_performing_reset = crud.get_admin(db, current_admin.username)
-    if not db_admin_orm_performing_reset:
-         raise HTTPException(status_code=403, detail="Performing admin not found in database.")
-
-    all_users_before_reset = crud.get_users(db=db, admins=None if current_admin.is_sudo else [current_admin.username])
-
-    crud.reset_all_users_data_usage(db=db, admin=None if current_admin.is_sudo else db_admin_orm_performing_reset)
-
-    logging.getLogger("marzban").info("All users' data usage reset. Scheduling XRay updates for affected active users.")
-    for user_before_reset in all_users_before_reset:
-        if user_before_reset.active_node_id:
-            user_after_reset = crud.get_user_by_id(db, user_before_reset.id)
-            if user_after_reset:
-                user_payload_for_xray = UserResponse.model_validate(user_after_reset, context={'db': db})
-                if user_after_reset.status in [UserStatus.active, UserStatus.on_hold]:
-                    logging.getLogger("marzban").debug(f"User {user_after_reset.account_number} active on node {user_after_reset.active_node_id} after global reset. Re-activating.")
-                    bg.add_task(xray.operations.activate_user_on_node,
-                                account_number=user_after_reset.account_number,
-                                node_id=user_after_reset.active_node_id)
-                else:
-                    logging.getLogger("marzban").debug(f"User {user_after_reset.account_number} inactive after global reset. Deactivating from node {user_before_reset.active_node_id}.")
-                    bg.add_task(xray.operations.deactivate_user_from_active_node,
-                                account_number=user_after_reset.account_number)
-
-    logging.getLogger("marzban").info(f"All users' data usage reset by admin '{current_admin.username}'. XRay updates scheduled.")
+    # check_sudo_admin already loaded the admin row, and sudo admins reset every user
+    crud.reset_all_users_data_usage(db=db)
+    invalidate_all_subscriptions()
+
+    logger.info("All users' data usage reset. Scheduling XRay updates for affected active users.")
+    # One batched sync per node instead of one node restart per user; the split is done in SQL
+    activate_by_node = defaultdict(list)
+    deactivate_by_node = defaultdict(list)
+    serving_statuses = [UserStatus.active, UserStatus.on_hold]
+    for account_number, node_id in crud.get_node_assigned_users(db, serving_statuses):
+        activate_by_node[node_id].append(account_number)
+    for account_number, node_id in crud.get_node_assigned_users(db, serving_statuses, exclude=True):
+        deactivate_by_node[node_id].append(account_number)
+
+    for node_id, account_numbers in activate_by_node.items():
+        logger.debug("Re-activating %d users on node %s after global reset.", len(account_numbers), node_id)
+        bg.add_task(xray.operations.activate_users_on_node, account_numbers=account_numbers, node_id=node_id)
+    for node_id, account_numbers in deactivate_by_node.items():
+        logger.debug("Deactivating %d inactive users from node %s after global reset.", len(account_numbers), node_id)
+        bg.add_task(xray.operations.deactivate_users_from_node, account_numbers=account_numbers, node_id=node_id)
+
+    logger.info("All users' data usage reset by admin '%s'. XRay updates scheduled.", current_admin.username)
     return {"detail": "All users' data usage successfully reset. XRay updates processing."}
 
 
@@ -336,23 +360,24 @@ def active_next_plan(
 
     active_node_id_before_next_plan = db_user_orm.active_node_id
     dbuser_reset_orm = crud.reset_user_by_next(db=db, dbuser=db_user_orm)
+    invalidate_user_subscriptions(dbuser_reset_orm.account_number)
 
     user_response_for_bg_and_report = UserResponse.model_validate(dbuser_reset_orm, context={'db': db})
 
     if active_node_id_before_next_plan is not None:
         if dbuser_reset_orm.status in [UserStatus.active, UserStatus.on_hold]:
-            logging.getLogger("marzban").info(f"User {dbuser_reset_orm.account_number} activated next plan. Re-activating on node {active_node_id_before_next_plan}.")
+            logger.info("User %s activated next plan. Re-activating on node %s.", dbuser_reset_orm.account_number, active_node_id_before_next_plan)
             bg.add_task(xray.operations.activate_user_on_node,
                         account_number=dbuser_reset_orm.account_number,
                         node_id=active_node_id_before_next_plan)
 
-    report.user_data_reset_by_next(
+    bg.add_task(
+        report.user_data_reset_by_next,
         user=user_response_for_bg_and_report,
         user_admin=dbuser_reset_orm.admin,
-        by=current_admin
     )
-    logging.getLogger("marzban").info(f'User "{dbuser_reset_orm.account_number}"\'s usage was reset by next plan')
-    return user_response_for_bg_and_report
+    logger.info('User "%s"\'s usage was reset by next plan', dbuser_reset_orm.account_number)
+    return json_response(user_response_for_bg_and_report.model_dump_json())
 
 
 @router.get("/usage", response_model=UsersUsagesResponse)
@@ -364,9 +389,12 @@ def get_all_users_usage_endpoint(
 ):
     start_dt_obj, end_dt_obj = validate_dates(start, end)
     usages = crud.get_all_users_usages(
-        db=db, start=start_dt_obj, end=end_dt_obj
+        db=db,
+        admin_usernames=None,
+        start=start_dt_obj,
+        end=end_dt_obj,
     )
-    return {"usages": usages}
+    return json_response(UsersUsagesResponse(usages=usages).model_dump_json())
 
 
 @router.get("/expired", response_model=List[str])
@@ -399,24 +427,21 @@ def delete_expired_users_endpoint(
     expired_users_orm_list = get_expired_users_list(db, current_admin, dt_expired_after, dt_expired_before)
     if not expired_users_orm_list: return []
 
-    removed_users_accounts = []
-    for user_orm in expired_users_orm_list:
-        removed_users_accounts.append(user_orm.account_number)
-        if user_orm.active_node_id is not None:
-            logging.getLogger("marzban").info(f"Expired user '{user_orm.account_number}' active on node {user_orm.active_node_id}. Scheduling deactivation.")
-            bg.add_task(xray.operations.deactivate_user_from_active_node, account_number=user_orm.account_number)
-
-        user_admin_for_report = user_orm.admin
-
-        bg.add_task(
-            report.user_deleted,
-            account_number=user_orm.account_number,
-            user_admin=user_admin_for_report,
-            by=current_admin,
-        )
-        logging.getLogger("marzban").info(f'Expired user "{user_orm.account_number}" scheduled for deletion by admin "{current_admin.username}"')
-
-    if expired_users_orm_list:
-        crud.remove_users(db, expired_users_orm_list)
+    removed_users = crud.remove_users_returning(db, [user_orm.id for user_orm in expired_users_orm_list])
+    invalidate_all_subscriptions()
+
+    # One config rebuild per node instead of one per user
+    deactivate_by_node = defaultdict(list)
+    for account_number, active_node_id in removed_users:
+        if active_node_id is not None:
+            deactivate_by_node[active_node_id].append(account_number)
+    for node_id, account_numbers in deactivate_by_node.items():
+        logger.info("Scheduling deactivation of %d expired users from node %s.", len(account_numbers), node_id)
+        bg.add_task(xray.operations.deactivate_users_from_node, account_numbers=account_numbers, node_id=node_id)
+
+    removed_users_accounts = [account_number for account_number, _ in removed_users]
+    # Users carry no owning-admin column, so deletions are reported without one
+    bg.add_task(report.users_deleted, deleted=[(account_number, None) for account_number in removed_users_accounts], by=current_admin)
+    logger.info("%d expired users deleted by admin '%s'.", len(removed_users_accounts), current_admin.username)
 
     return removed_users_accounts
\ No newline at end of file
@@ -9,27 +9,207 @@ This service handles:
 - Secure storage and retrieval
 """
 
+import hashlib
+import ipaddress
 import os
-import tempfile
+import queue
+import threading
 import logging
 from datetime import datetime, timedelta
-from typing import Tuple, Optional, Dict, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Tuple, Optional, Dict, Any, List
 from dataclasses import dataclass
 from pathlib import Path
 
 from cryptography import x509
-from cryptography.x509.oid import NameOID
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, NoEncryption
 from sqlalchemy.orm import Session
 
 from app.db import crud
 from app.db.models import CertificateAuthority, NodeCertificate
+from app.utils.store import TTLStorage
 import config
 
 logger = logging.getLogger(__name__)
 
+_LOCALHOST_V4 = ipaddress.IPv4Address('127.0.0.1')
+_LOCALHOST_V4_SAN = x509.IPAddress(_LOCALHOST_V4)
+_LOCALHOST_DNS = x509.DNSName('localhost')
+
+# Extensions shared by every certificate of a kind; only keys, names and SANs vary per certificate
+_CA_BASIC = x509.BasicConstraints(ca=True, path_length=None)
+_LEAF_BASIC = x509.BasicConstraints(ca=False, path_length=None)
+_CA_KEY_USAGE = x509.KeyUsage(
+    key_cert_sign=True,
+    crl_sign=True,
+    digital_signature=False,
+    content_commitment=False,
+    key_encipherment=False,
+    data_encipherment=False,
+    key_agreement=False,
+    encipher_only=False,
+    decipher_only=False
+)
+
+
+def _leaf_key_usage(key_encipherment: bool) -> x509.KeyUsage:
+    return x509.KeyUsage(
+        key_cert_sign=False,
+        crl_sign=False,
+        digital_signature=True,
+        content_commitment=False,
+        key_encipherment=key_encipherment,
+        data_encipherment=False,
+        key_agreement=False,
+        encipher_only=False,
+        decipher_only=False
+    )
+
+
+# key_encipherment only applies to RSA key transport
+_LEAF_KEY_USAGE = _leaf_key_usage(False)
+_LEAF_KEY_USAGE_RSA = _leaf_key_usage(True)
+_SERVER_EKU = x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH])
+_CLIENT_EKU = x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH])
+_SIG_HASH = hashes.SHA256()
+
+_keygen_pool: Optional[ProcessPoolExecutor] = None
+
+# NodeCertificates by "full:"/"lite:" + node name; dashboards poll these far more often than they change.
+# Other workers only see a rotation once their entry expires, hence the short TTL.
+_node_cert_cache = TTLStorage(default_ttl=60, max_size=1024)
+
+# Spare 2048-bit RSA leaf keys, topped up by a daemon thread so request paths skip the prime search
+_RSA_KEY_POOL_SIZE = 16
+_rsa_key_pool: "queue.Queue[rsa.RSAPrivateKey]" = queue.Queue(maxsize=_RSA_KEY_POOL_SIZE)
+_rsa_key_pool_thread: Optional[threading.Thread] = None
+_rsa_key_pool_lock = threading.Lock()
+
+# blake2b digest of a certificate PEM -> not_valid_after, so validity checks skip the ASN.1 parse
+_VALIDITY_CACHE: Dict[bytes, datetime] = {}
+_VALIDITY_CACHE_SIZE = 1024
+
+
+def _generate_private_key(algo: str, key_size: int = 2048):
+    # EC and Ed25519 keys skip RSA's prime search, which dominates CA and node provisioning time
+    if algo == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algo == "ecdsa":
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=key_size,
+    )
+
+
+def _private_key_pem(private_key) -> bytes:
+    return private_key.private_bytes(
+        Encoding.PEM,
+        PrivateFormat.PKCS8,
+        NoEncryption()
+    )
+
+
+def _generate_private_key_der(algo: str, key_size: int) -> bytes:
+    """Process-pool entry point; keys cross the process boundary as DER, which skips base64"""
+    return _generate_private_key(algo, key_size).private_bytes(
+        Encoding.DER,
+        PrivateFormat.PKCS8,
+        NoEncryption()
+    )
+
+
+def _serialize_pems(cert: x509.Certificate, private_key, public_key) -> Tuple[str, str, str]:
+    """Certificate, private key and public key PEMs; stored as text in the DB and returned in JSON"""
+    cert_pem = cert.public_bytes(Encoding.PEM).decode('ascii')
+    # The certificate object is at hand, so later validity checks of this PEM never parse it
+    _remember_not_valid_after(cert_pem, cert.not_valid_after_utc.replace(tzinfo=None))
+    return (
+        cert_pem,
+        _private_key_pem(private_key).decode('ascii'),
+        public_key.public_bytes(
+            Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('ascii'),
+    )
+
+
+def _validity_key(cert_pem: str) -> bytes:
+    return hashlib.blake2b(cert_pem.encode('utf-8'), digest_size=16).digest()
+
+
+def _remember_not_valid_after(cert_pem: str, not_valid_after: datetime) -> None:
+    if len(_VALIDITY_CACHE) >= _VALIDITY_CACHE_SIZE:
+        _VALIDITY_CACHE.clear()
+    _VALIDITY_CACHE[_validity_key(cert_pem)] = not_valid_after
+
+
+def _certificate_not_valid_after(cert_pem: str) -> datetime:
+    """Expiry of a PEM certificate, parsed once per distinct certificate"""
+    not_valid_after = _VALIDITY_CACHE.get(_validity_key(cert_pem))
+    if not_valid_after is None:
+        not_valid_after = x509.load_pem_x509_certificate(cert_pem.encode('utf-8')).not_valid_after_utc.replace(tzinfo=None)
+        _remember_not_valid_after(cert_pem, not_valid_after)
+    return not_valid_after
+
+
+def _write_file(path: Path, content: bytes, mode: int) -> None:
+    """Write a file whose permissions are set at creation, so keys are never briefly world-readable"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        # O_CREAT's mode only applies to new files; tighten a pre-existing one before writing
+        os.fchmod(fd, mode)
+        os.write(fd, content)
+    finally:
+        os.close(fd)
+
+
+def _docker_export_files(export_path: Path, ca_pem: bytes, server_pem: str, server_key_pem: str,
+                         panel_pem: str, panel_key_pem: str) -> List[Tuple[str, Path, bytes, int]]:
+    """(result key, path, content, mode) of a node's Docker export; creates export_path"""
+    export_path.mkdir(parents=True, exist_ok=True)
+    # CA (node verifies panel), server pair (node HTTPS), panel client pair (panel authenticates)
+    return [
+        ("ca_cert", export_path / "ca.crt", ca_pem, 0o644),
+        ("server_cert", export_path / "server.crt", server_pem.encode('utf-8'), 0o644),
+        ("server_key", export_path / "server.key", server_key_pem.encode('utf-8'), 0o600),
+        ("panel_client_cert", export_path / "panel-client.crt", panel_pem.encode('utf-8'), 0o644),
+        ("panel_client_key", export_path / "panel-client.key", panel_key_pem.encode('utf-8'), 0o600),
+    ]
+
+
+def _fill_rsa_key_pool() -> None:
+    while True:
+        # put() blocks while the pool is full, so the thread idles until keys are taken
+        _rsa_key_pool.put(_generate_private_key("rsa", 2048))
+
+
+def _take_pooled_rsa_key() -> Optional[rsa.RSAPrivateKey]:
+    """A pre-generated RSA leaf key if one is ready; starts the filler thread on first use"""
+    global _rsa_key_pool_thread
+    if _rsa_key_pool_thread is None:
+        with _rsa_key_pool_lock:
+            if _rsa_key_pool_thread is None:
+                _rsa_key_pool_thread = threading.Thread(
+                    target=_fill_rsa_key_pool, name="rsa-key-pool", daemon=True
+                )
+                _rsa_key_pool_thread.start()
+    try:
+        return _rsa_key_pool.get_nowait()
+    except queue.Empty:
+        return None
+
+
+def _get_keygen_pool() -> ProcessPoolExecutor:
+    global _keygen_pool
+    if _keygen_pool is None:
+        _keygen_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _keygen_pool
+
+
 @dataclass
 class CertificateInfo:
     """Certificate information container"""
@@ -62,39 +242,47 @@ class CertificateManager:
     - Secure storage in database with encryption
     """
 
+    # Shared subject prefix; only OU and CN vary between the CA, node and panel certificates
+    _BASE_NAME_ATTRS = [
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CA"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "San Francisco"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Marzban"),
+    ]
+
     def __init__(self, db: Session):
         self.db = db
         self.ca_subject_name = "Marzban Certificate Authority"
         self.ca_validity_days = 3650  # 10 years for CA
         self.cert_validity_days = 365  # 1 year for server/client certs
+        # Parsed (private key, certificate) per CA serial, reused across node issuances
+        self._ca_parsed_cache: Dict[str, Tuple[Any, x509.Certificate, x509.AuthorityKeyIdentifier]] = {}
+        # CA looked up by this manager; saves a DB fetch and PEM validity parse per call
+        self._ca_cache: Optional[CertificateInfo] = None
 
-    def get_or_create_ca(self) -> CertificateInfo:
+    def get_or_create_ca(self, commit: bool = True) -> CertificateInfo:
         """
         Get existing CA or create new one if none exists
 
+        Args:
+            commit: Commit a newly generated CA; False leaves it to the caller's transaction
+
         Returns:
             CertificateInfo: CA certificate and private key information
         """
+        if self._ca_cache and self._ca_cache.valid_until > datetime.utcnow() + timedelta(days=30):
+            return self._ca_cache
+
         # Try to get existing CA from database
         ca_record = crud.get_certificate_authority(self.db)
 
-        if ca_record and self._is_certificate_valid(ca_record.certificate_pem):
+        if ca_record and self._is_record_valid(ca_record):
             logger.info("Using existing CA certificate")
-            return CertificateInfo(
-                certificate_pem=ca_record.certificate_pem,
-                private_key_pem=ca_record.private_key_pem,
-                public_key_pem=ca_record.public_key_pem,
-                subject_name=ca_record.subject_name,
-                issuer_name=ca_record.issuer_name,
-                serial_number=ca_record.serial_number,
-                valid_from=ca_record.valid_from,
-                valid_until=ca_record.valid_until,
-                is_ca=True
-            )
+            return self._use_ca_record(ca_record)
 
         # Generate new CA
         logger.info("Generating new CA certificate")
-        return self._generate_ca_certificate()
+        return self._generate_ca_certificate(commit=commit)
 
     def generate_node_certificates(self, node_name: str, node_address: str) -> NodeCertificates:
         """
@@ -109,21 +297,28 @@ class CertificateManager:
         """
         logger.info(f"Generating certificates for node: {node_name}")
 
-        # Get or create CA
-        ca_cert = self.get_or_create_ca()
+        try:
+            # Get or create CA
+            ca_cert = self.get_or_create_ca(commit=False)
+            valid_from = datetime.utcnow()
 
-        # Generate server certificate for the node
-        server_cert = self._generate_server_certificate(
-            node_name, node_address, ca_cert
-        )
+            # Generate server certificate for the node
+            server_cert = self._generate_server_certificate(
+                node_name, node_address, ca_cert, valid_from=valid_from
+            )
 
-        # Generate client certificate for panel to authenticate with this node
-        panel_client_cert = self._generate_client_certificate(
-            f"panel-client-{node_name}", ca_cert
-        )
+            # Generate client certificate for panel to authenticate with this node
+            panel_client_cert = self._generate_client_certificate(
+                f"panel-client-{node_name}", ca_cert, valid_from=valid_from
+            )
 
-        # Store certificates in database
-        self._store_node_certificates(node_name, server_cert, panel_client_cert)
+            # Store certificates in database; a new CA and the node certs land in one commit
+            self._store_node_certificates(node_name, server_cert, panel_client_cert, commit=False)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._ca_cache = None
+            raise
 
         return NodeCertificates(
             ca_cert=ca_cert,
@@ -131,6 +326,49 @@ class CertificateManager:
             panel_client_cert=panel_client_cert
         )
 
+    def generate_node_certificates_bulk(self, nodes: List[Tuple[str, str]]) -> Dict[str, NodeCertificates]:
+        """
+        Generate certificate sets for many nodes, e.g. after a CA change
+
+        Args:
+            nodes: (node_name, node_address) pairs
+
+        Returns:
+            Dict of node name to its new certificate set; failed nodes are logged and skipped
+        """
+        ca_cert = self.get_or_create_ca(commit=False)
+        private_keys = iter(self._pregenerate_private_keys(2 * len(nodes)))
+        valid_from = datetime.utcnow()
+
+        generated = {}
+        for node_name, node_address in nodes:
+            server_key, client_key = next(private_keys), next(private_keys)
+            try:
+                server_cert = self._generate_server_certificate(
+                    node_name, node_address, ca_cert, private_key=server_key, valid_from=valid_from
+                )
+                panel_client_cert = self._generate_client_certificate(
+                    f"panel-client-{node_name}", ca_cert, private_key=client_key, valid_from=valid_from
+                )
+                self._store_node_certificates(node_name, server_cert, panel_client_cert, commit=False)
+            except Exception as e:
+                logger.error(f"Failed to generate certificates for node {node_name}: {e}")
+                continue
+            generated[node_name] = NodeCertificates(
+                ca_cert=ca_cert,
+                server_cert=server_cert,
+                panel_client_cert=panel_client_cert
+            )
+
+        # One commit for the CA (if new) and every node's certificates
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._ca_cache = None
+            raise
+        return generated
+
     def get_node_certificates(self, node_name: str) -> Optional[NodeCertificates]:
         """
         Retrieve existing certificates for a node
@@ -141,37 +379,60 @@ class CertificateManager:
         Returns:
             NodeCertificates if found, None otherwise
         """
-        node_cert_record = crud.get_node_certificate(self.db, node_name)
-        if not node_cert_record:
+        cached = _node_cert_cache.get(f"full:{node_name}")
+        if cached is not None:
+            return cached
+
+        # Node certificates and the CA come back in one query
+        row = crud.get_node_certificate_with_ca(self.db, node_name)
+        if not row:
             return None
 
-        ca_cert = self.get_or_create_ca()
+        node_cert_record, ca_record = row
+        node_certs = self._node_certificates_from_record(node_cert_record, self._ca_from_joined_record(ca_record))
+        _node_cert_cache.set(f"full:{node_name}", node_certs)
+        return node_certs
 
-        return NodeCertificates(
-            ca_cert=ca_cert,
-            server_cert=CertificateInfo(
-                certificate_pem=node_cert_record.server_certificate_pem,
-                private_key_pem=node_cert_record.server_private_key_pem,
-                public_key_pem=node_cert_record.server_public_key_pem,
-                subject_name=node_cert_record.subject_name,
-                issuer_name=node_cert_record.issuer_name,
-                serial_number=node_cert_record.serial_number,
-                valid_from=node_cert_record.valid_from,
-                valid_until=node_cert_record.valid_until,
-                is_ca=False
-            ),
-            panel_client_cert=CertificateInfo(
-                certificate_pem=node_cert_record.panel_client_certificate_pem,
-                private_key_pem=node_cert_record.panel_client_private_key_pem,
-                public_key_pem=node_cert_record.panel_client_public_key_pem,
-                subject_name=f"panel-client-{node_name}",
-                issuer_name=ca_cert.subject_name,
-                serial_number="", # TODO: Store this
-                valid_from=node_cert_record.valid_from,
-                valid_until=node_cert_record.valid_until,
-                is_ca=False
-            )
+    def get_node_certificates_lite(self, node_name: str) -> Optional[NodeCertificates]:
+        """
+        Retrieve node certificates with only the public half of the CA
+
+        For callers that hand out the CA certificate but never sign with it: the CA
+        private and public key PEMs are left empty and the CA is not re-validated.
+
+        Args:
+            node_name: Name of the node
+
+        Returns:
+            NodeCertificates or None if not found
+        """
+        cached = _node_cert_cache.get(f"lite:{node_name}") or _node_cert_cache.get(f"full:{node_name}")
+        if cached is not None:
+            return cached
+
+        row = crud.get_node_certificate_with_ca_public(self.db, node_name)
+        if not row:
+            return None
+
+        node_cert_record, ca_pem, ca_subject, ca_issuer, ca_serial, ca_valid_from, ca_valid_until = row
+        if ca_pem is None:
+            # Node certificates without a CA row; let the full lookup recreate it
+            return self.get_node_certificates(node_name)
+
+        ca_cert = CertificateInfo(
+            certificate_pem=ca_pem,
+            private_key_pem="",
+            public_key_pem="",
+            subject_name=ca_subject,
+            issuer_name=ca_issuer,
+            serial_number=ca_serial,
+            valid_from=ca_valid_from,
+            valid_until=ca_valid_until,
+            is_ca=True
         )
+        node_certs = self._node_certificates_from_record(node_cert_record, ca_cert)
+        _node_cert_cache.set(f"lite:{node_name}", node_certs)
+        return node_certs
 
     def rotate_certificates(self, node_name: str) -> NodeCertificates:
         """
@@ -204,60 +465,71 @@ class CertificateManager:
         Returns:
             Dict with file paths for Docker volume mounting
         """
-        node_certs = self.get_node_certificates(node_name)
+        node_certs = self.get_node_certificates_lite(node_name)
         if not node_certs:
             raise ValueError(f"No certificates found for node: {node_name}")
 
-        export_path = Path(export_dir)
-        export_path.mkdir(parents=True, exist_ok=True)
+        files = _docker_export_files(
+            Path(export_dir),
+            node_certs.ca_cert.certificate_pem.encode('utf-8'),
+            node_certs.server_cert.certificate_pem,
+            node_certs.server_cert.private_key_pem,
+            node_certs.panel_client_cert.certificate_pem,
+            node_certs.panel_client_cert.private_key_pem,
+        )
+        # The files are independent, so slow (e.g. network-mounted) volumes are written concurrently
+        with ThreadPoolExecutor(max_workers=len(files)) as executor:
+            list(executor.map(lambda f: _write_file(*f[1:]), files))
 
-        # Export CA certificate (for node to verify panel)
-        ca_file = export_path / "ca.crt"
-        ca_file.write_text(node_certs.ca_cert.certificate_pem)
+        logger.info(f"Exported certificates for node {node_name} to {export_dir}")
 
-        # Export server certificate and key (for node HTTPS server)
-        server_cert_file = export_path / "server.crt"
-        server_key_file = export_path / "server.key"
-        server_cert_file.write_text(node_certs.server_cert.certificate_pem)
-        server_key_file.write_text(node_certs.server_cert.private_key_pem)
+        return {key: str(path) for key, path, _, _ in files}
 
-        # Export panel client certificate (for panel to authenticate with node)
-        panel_cert_file = export_path / "panel-client.crt"
-        panel_key_file = export_path / "panel-client.key"
-        panel_cert_file.write_text(node_certs.panel_client_cert.certificate_pem)
-        panel_key_file.write_text(node_certs.panel_client_cert.private_key_pem)
+    def export_all_certificates_for_docker(self, export_dir: str, node_names: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
+        """
+        Export certificates of many nodes for Docker mounting, one subdirectory per node
 
-        # Set proper permissions
-        for file_path in [server_key_file, panel_key_file]:
-            file_path.chmod(0o600)  # Read-only for owner
+        Only the PEM columns are selected, in a single query, and the CA certificate is
+        encoded once for all nodes; meant for bulk redeploys.
 
-        logger.info(f"Exported certificates for node {node_name} to {export_dir}")
+        Args:
+            export_dir: Directory to create the per-node directories in
+            node_names: Nodes to export; all nodes with certificates when None
 
-        return {
-            "ca_cert": str(ca_file),
-            "server_cert": str(server_cert_file),
-            "server_key": str(server_key_file),
-            "panel_client_cert": str(panel_cert_file),
-            "panel_client_key": str(panel_key_file)
-        }
+        Returns:
+            Dict of node name to the file paths export_certificates_for_docker returns
+        """
+        ca_record = crud.get_certificate_authority(self.db)
+        if not ca_record:
+            raise ValueError("No certificate authority found")
+        ca_pem = ca_record.certificate_pem.encode('utf-8')
 
-    def _generate_ca_certificate(self) -> CertificateInfo:
+        export_path = Path(export_dir)
+        exported = {}
+        files = []
+        for node_name, server_pem, server_key, panel_pem, panel_key in crud.get_node_certificate_pems(self.db, node_names):
+            if Path(node_name).name != node_name or node_name in (".", ".."):
+                raise ValueError(f"Node name {node_name!r} can't be used as a directory name")
+            node_files = _docker_export_files(export_path / node_name, ca_pem, server_pem, server_key, panel_pem, panel_key)
+            exported[node_name] = {key: str(path) for key, path, _, _ in node_files}
+            files.extend(node_files)
+
+        if files:
+            with ThreadPoolExecutor(max_workers=min(len(files), 16)) as executor:
+                list(executor.map(lambda f: _write_file(*f[1:]), files))
+
+        logger.info(f"Exported certificates for {len(exported)} nodes to {export_dir}")
+
+        return exported
+
+    def _generate_ca_certificate(self, commit: bool = True) -> CertificateInfo:
         """Generate new CA certificate and store in database"""
         # Generate private key
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=4096,
-        )
+        private_key = self._generate_private_key(key_size=4096)
+        public_key = private_key.public_key()
 
         # Create certificate subject
-        subject = x509.Name([
-            x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
-            x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CA"),
-            x509.NameAttribute(NameOID.LOCALITY_NAME, "San Francisco"),
-            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Marzban"),
-            x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, "Certificate Authority"),
-            x509.NameAttribute(NameOID.COMMON_NAME, self.ca_subject_name),
-        ])
+        subject = self._build_subject("Certificate Authority", self.ca_subject_name)
 
         # Generate serial number
         serial_number = x509.random_serial_number()
@@ -272,7 +544,7 @@ class CertificateManager:
         ).issuer_name(
             subject  # Self-signed
         ).public_key(
-            private_key.public_key()
+            public_key
         ).serial_number(
             serial_number
         ).not_valid_before(
@@ -280,37 +552,18 @@ class CertificateManager:
         ).not_valid_after(
             valid_until
         ).add_extension(
-            x509.BasicConstraints(ca=True, path_length=None),
+            _CA_BASIC,
             critical=True,
         ).add_extension(
-            x509.KeyUsage(
-                key_cert_sign=True,
-                crl_sign=True,
-                digital_signature=False,
-                content_commitment=False,
-                key_encipherment=False,
-                data_encipherment=False,
-                key_agreement=False,
-                encipher_only=False,
-                decipher_only=False
-            ),
+            _CA_KEY_USAGE,
             critical=True,
         ).add_extension(
-            x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()),
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
             critical=False,
-        ).sign(private_key, hashes.SHA256())
+        ).sign(private_key, self._signature_hash(private_key))
 
         # Serialize certificates and keys
-        cert_pem = cert.public_bytes(Encoding.PEM).decode('utf-8')
-        private_key_pem = private_key.private_bytes(
-            Encoding.PEM,
-            PrivateFormat.PKCS8,
-            NoEncryption()
-        ).decode('utf-8')
-        public_key_pem = private_key.public_key().public_bytes(
-            Encoding.PEM,
-            serialization.PublicFormat.SubjectPublicKeyInfo
-        ).decode('utf-8')
+        cert_pem, private_key_pem, public_key_pem = _serialize_pems(cert, private_key, public_key)
 
         # Create certificate info
         cert_info = CertificateInfo(
@@ -325,42 +578,36 @@ class CertificateManager:
             is_ca=True
         )
 
+        # A new CA supersedes any cached or parsed one
+        self._ca_parsed_cache.clear()
+        _node_cert_cache.clear()
+        self._ca_cache = cert_info
+
         # Store in database
-        crud.create_or_update_certificate_authority(self.db, cert_info)
+        crud.create_or_update_certificate_authority(self.db, cert_info, commit=commit)
 
         logger.info(f"Generated new CA certificate (valid until: {valid_until})")
         return cert_info
 
-    def _generate_server_certificate(self, node_name: str, node_address: str, ca_cert: CertificateInfo) -> CertificateInfo:
+    def _generate_server_certificate(self, node_name: str, node_address: str, ca_cert: CertificateInfo,
+                                     private_key=None, valid_from: Optional[datetime] = None) -> CertificateInfo:
         """Generate server certificate for node"""
         # Load CA private key
-        ca_private_key = serialization.load_pem_private_key(
-            ca_cert.private_key_pem.encode('utf-8'),
-            password=None,
-        )
-        ca_certificate = x509.load_pem_x509_certificate(ca_cert.certificate_pem.encode('utf-8'))
+        ca_private_key, ca_certificate, authority_key_id = self._load_ca(ca_cert)
 
-        # Generate private key for server
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+        # Generate private key for server unless one was pre-generated
+        if private_key is None:
+            private_key = self._generate_private_key()
+        public_key = private_key.public_key()
 
         # Create subject
-        subject = x509.Name([
-            x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
-            x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CA"),
-            x509.NameAttribute(NameOID.LOCALITY_NAME, "San Francisco"),
-            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Marzban"),
-            x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, "Node"),
-            x509.NameAttribute(NameOID.COMMON_NAME, node_name),
-        ])
+        subject = self._build_subject("Node", node_name)
 
         # Generate serial number
         serial_number = x509.random_serial_number()
 
-        # Set validity period
-        valid_from = datetime.utcnow()
+        # Set validity period; callers issuing several certificates share one timestamp
+        valid_from = valid_from or datetime.utcnow()
         valid_until = valid_from + timedelta(days=self.cert_validity_days)
 
         # Build server certificate
@@ -369,7 +616,7 @@ class CertificateManager:
         ).issuer_name(
             ca_certificate.subject
         ).public_key(
-            private_key.public_key()
+            public_key
         ).serial_number(
             serial_number
         ).not_valid_before(
@@ -377,48 +624,27 @@ class CertificateManager:
         ).not_valid_after(
             valid_until
         ).add_extension(
-            x509.BasicConstraints(ca=False, path_length=None),
+            _LEAF_BASIC,
             critical=True,
         ).add_extension(
-            x509.KeyUsage(
-                key_cert_sign=False,
-                crl_sign=False,
-                digital_signature=True,
-                content_commitment=False,
-                key_encipherment=True,
-                data_encipherment=False,
-                key_agreement=False,
-                encipher_only=False,
-                decipher_only=False
-            ),
+            _LEAF_KEY_USAGE_RSA if isinstance(private_key, rsa.RSAPrivateKey) else _LEAF_KEY_USAGE,
             critical=True,
         ).add_extension(
-            x509.ExtendedKeyUsage([
-                x509.oid.ExtendedKeyUsageOID.SERVER_AUTH,
-            ]),
+            _SERVER_EKU,
             critical=True,
         ).add_extension(
             x509.SubjectAlternativeName(self._build_san_list(node_name, node_address)),
             critical=False,
         ).add_extension(
-            x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()),
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
             critical=False,
         ).add_extension(
-            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_private_key.public_key()),
+            authority_key_id,
             critical=False,
-        ).sign(ca_private_key, hashes.SHA256())
+        ).sign(ca_private_key, self._signature_hash(ca_private_key))
 
         # Serialize
-        cert_pem = cert.public_bytes(Encoding.PEM).decode('utf-8')
-        private_key_pem = private_key.private_bytes(
-            Encoding.PEM,
-            PrivateFormat.PKCS8,
-            NoEncryption()
-        ).decode('utf-8')
-        public_key_pem = private_key.public_key().public_bytes(
-            Encoding.PEM,
-            serialization.PublicFormat.SubjectPublicKeyInfo
-        ).decode('utf-8')
+        cert_pem, private_key_pem, public_key_pem = _serialize_pems(cert, private_key, public_key)
 
         return CertificateInfo(
             certificate_pem=cert_pem,
@@ -432,36 +658,25 @@ class CertificateManager:
             is_ca=False
         )
 
-    def _generate_client_certificate(self, client_name: str, ca_cert: CertificateInfo) -> CertificateInfo:
+    def _generate_client_certificate(self, client_name: str, ca_cert: CertificateInfo,
+                                     private_key=None, valid_from: Optional[datetime] = None) -> CertificateInfo:
         """Generate client certificate for panel"""
         # Load CA private key
-        ca_private_key = serialization.load_pem_private_key(
-            ca_cert.private_key_pem.encode('utf-8'),
-            password=None,
-        )
-        ca_certificate = x509.load_pem_x509_certificate(ca_cert.certificate_pem.encode('utf-8'))
+        ca_private_key, ca_certificate, authority_key_id = self._load_ca(ca_cert)
 
-        # Generate private key for client
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+        # Generate private key for client unless one was pre-generated
+        if private_key is None:
+            private_key = self._generate_private_key()
+        public_key = private_key.public_key()
 
         # Create subject
-        subject = x509.Name([
-            x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
-            x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CA"),
-            x509.NameAttribute(NameOID.LOCALITY_NAME, "San Francisco"),
-            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Marzban"),
-            x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, "Panel"),
-            x509.NameAttribute(NameOID.COMMON_NAME, client_name),
-        ])
+        subject = self._build_subject("Panel", client_name)
 
         # Generate serial number
         serial_number = x509.random_serial_number()
 
-        # Set validity period
-        valid_from = datetime.utcnow()
+        # Set validity period; callers issuing several certificates share one timestamp
+        valid_from = valid_from or datetime.utcnow()
         valid_until = valid_from + timedelta(days=self.cert_validity_days)
 
         # Build client certificate
@@ -470,7 +685,7 @@ class CertificateManager:
         ).issuer_name(
             ca_certificate.subject
         ).public_key(
-            private_key.public_key()
+            public_key
         ).serial_number(
             serial_number
         ).not_valid_before(
@@ -478,45 +693,24 @@ class CertificateManager:
         ).not_valid_after(
             valid_until
         ).add_extension(
-            x509.BasicConstraints(ca=False, path_length=None),
+            _LEAF_BASIC,
             critical=True,
         ).add_extension(
-            x509.KeyUsage(
-                key_cert_sign=False,
-                crl_sign=False,
-                digital_signature=True,
-                content_commitment=False,
-                key_encipherment=True,
-                data_encipherment=False,
-                key_agreement=False,
-                encipher_only=False,
-                decipher_only=False
-            ),
+            _LEAF_KEY_USAGE_RSA if isinstance(private_key, rsa.RSAPrivateKey) else _LEAF_KEY_USAGE,
             critical=True,
         ).add_extension(
-            x509.ExtendedKeyUsage([
-                x509.oid.ExtendedKeyUsageOID.CLIENT_AUTH,
-            ]),
+            _CLIENT_EKU,
             critical=True,
         ).add_extension(
-            x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()),
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
             critical=False,
         ).add_extension(
-            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_private_key.public_key()),
+            authority_key_id,
             critical=False,
-        ).sign(ca_private_key, hashes.SHA256())
+        ).sign(ca_private_key, self._signature_hash(ca_private_key))
 
         # Serialize
-        cert_pem = cert.public_bytes(Encoding.PEM).decode('utf-8')
-        private_key_pem = private_key.private_bytes(
-            Encoding.PEM,
-            PrivateFormat.PKCS8,
-            NoEncryption()
-        ).decode('utf-8')
-        public_key_pem = private_key.public_key().public_bytes(
-            Encoding.PEM,
-            serialization.PublicFormat.SubjectPublicKeyInfo
-        ).decode('utf-8')
+        cert_pem, private_key_pem, public_key_pem = _serialize_pems(cert, private_key, public_key)
 
         return CertificateInfo(
             certificate_pem=cert_pem,
@@ -530,63 +724,165 @@ class CertificateManager:
             is_ca=False
         )
 
-    def _store_node_certificates(self, node_name: str, server_cert: CertificateInfo, panel_client_cert: CertificateInfo):
+    def _use_ca_record(self, ca_record: CertificateAuthority) -> CertificateInfo:
+        """Wrap a stored CA record and remember it for this manager"""
+        self._ca_cache = CertificateInfo(
+            certificate_pem=ca_record.certificate_pem,
+            private_key_pem=ca_record.private_key_pem,
+            public_key_pem=ca_record.public_key_pem,
+            subject_name=ca_record.subject_name,
+            issuer_name=ca_record.issuer_name,
+            serial_number=ca_record.serial_number,
+            valid_from=ca_record.valid_from,
+            valid_until=ca_record.valid_until,
+            is_ca=True
+        )
+        return self._ca_cache
+
+    def _ca_from_joined_record(self, ca_record: Optional[CertificateAuthority]) -> CertificateInfo:
+        """Use a CA loaded alongside node certificates, falling back to get_or_create_ca"""
+        if self._ca_cache and self._ca_cache.serial_number == getattr(ca_record, "serial_number", None):
+            return self._ca_cache
+        if ca_record and self._is_record_valid(ca_record):
+            return self._use_ca_record(ca_record)
+        return self.get_or_create_ca()
+
+    def _node_certificates_from_record(self, node_cert_record: NodeCertificate, ca_cert: CertificateInfo) -> NodeCertificates:
+        """Package a stored node certificate record with its CA"""
+        return NodeCertificates(
+            ca_cert=ca_cert,
+            server_cert=CertificateInfo(
+                certificate_pem=node_cert_record.server_certificate_pem,
+                private_key_pem=node_cert_record.server_private_key_pem,
+                public_key_pem=node_cert_record.server_public_key_pem,
+                subject_name=node_cert_record.subject_name,
+                issuer_name=node_cert_record.issuer_name,
+                serial_number=node_cert_record.serial_number,
+                valid_from=node_cert_record.valid_from,
+                valid_until=node_cert_record.valid_until,
+                is_ca=False
+            ),
+            panel_client_cert=CertificateInfo(
+                certificate_pem=node_cert_record.panel_client_certificate_pem,
+                private_key_pem=node_cert_record.panel_client_private_key_pem,
+                public_key_pem=node_cert_record.panel_client_public_key_pem,
+                subject_name=f"panel-client-{node_cert_record.node_name}",
+                issuer_name=ca_cert.subject_name,
+                serial_number="", # TODO: Store this
+                valid_from=node_cert_record.valid_from,
+                valid_until=node_cert_record.valid_until,
+                is_ca=False
+            )
+        )
+
+    def _build_subject(self, organizational_unit: str, common_name: str) -> x509.Name:
+        """Build a certificate subject from the shared prefix plus OU and CN"""
+        return x509.Name(self._BASE_NAME_ATTRS + [
+            x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, organizational_unit),
+            x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+        ])
+
+    def _load_ca(self, ca_cert: CertificateInfo) -> Tuple[Any, x509.Certificate, x509.AuthorityKeyIdentifier]:
+        """Parse the CA key and certificate PEMs, and derive the issued certs' AKI, once per CA serial"""
+        parsed = self._ca_parsed_cache.get(ca_cert.serial_number)
+        if parsed is None:
+            ca_private_key = serialization.load_pem_private_key(ca_cert.private_key_pem.encode('utf-8'), password=None)
+            ca_certificate = x509.load_pem_x509_certificate(ca_cert.certificate_pem.encode('utf-8'))
+            try:
+                # Reuse the CA's own SKI instead of re-deriving and hashing its public key
+                ski = ca_certificate.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value
+                authority_key_id = x509.AuthorityKeyIdentifier.from_issuer_subject_key_identifier(ski)
+            except x509.ExtensionNotFound:
+                authority_key_id = x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_certificate.public_key())
+            parsed = (ca_private_key, ca_certificate, authority_key_id)
+            self._ca_parsed_cache[ca_cert.serial_number] = parsed
+        return parsed
+
+    def _generate_private_key(self, key_size: int = 2048):
+        """Generate a private key using the configured CERT_KEY_ALGO"""
+        if config.CERT_KEY_ALGO == "rsa" and key_size == 2048:
+            pooled = _take_pooled_rsa_key()
+            if pooled is not None:
+                return pooled
+        return _generate_private_key(config.CERT_KEY_ALGO, key_size)
+
+    def _pregenerate_private_keys(self, count: int) -> List[Optional[Any]]:
+        """
+        Generate leaf keys for a batch up front, in parallel when that pays off
+
+        Only RSA keys are worth a process pool; EC and Ed25519 keys are cheaper than
+        the round-trip, so for those None is returned and keys are generated inline.
+        """
+        if config.CERT_KEY_ALGO != "rsa" or count < 2:
+            return [None] * count
+        keys = []
+        while len(keys) < count:
+            pooled = _take_pooled_rsa_key()
+            if pooled is None:
+                break
+            keys.append(pooled)
+        missing = count - len(keys)
+        if missing:
+            ders = _get_keygen_pool().map(_generate_private_key_der, ["rsa"] * missing, [2048] * missing)
+            keys.extend(serialization.load_der_private_key(der, password=None) for der in ders)
+        return keys
+
+    @staticmethod
+    def _signature_hash(signing_key) -> Optional[hashes.HashAlgorithm]:
+        """Ed25519 signs without a separate digest; RSA and ECDSA use SHA-256"""
+        if isinstance(signing_key, ed25519.Ed25519PrivateKey):
+            return None
+        return _SIG_HASH
+
+    def _store_node_certificates(self, node_name: str, server_cert: CertificateInfo, panel_client_cert: CertificateInfo,
+                                 commit: bool = True):
         """Store node certificates in database"""
+        _node_cert_cache.delete(f"full:{node_name}")
+        _node_cert_cache.delete(f"lite:{node_name}")
         crud.create_or_update_node_certificate(
             self.db,
             node_name,
             server_cert,
-            panel_client_cert
+            panel_client_cert,
+            commit=commit
         )
 
+    @staticmethod
+    def _is_record_valid(record, days_ahead: int = 30) -> bool:
+        """Check a stored certificate via its valid_until column; no PEM parsing needed"""
+        return record.valid_until > datetime.utcnow() + timedelta(days=days_ahead)
+
     def _is_certificate_valid(self, cert_pem: str, days_ahead: int = 30) -> bool:
-        """Check if certificate is valid and not expiring soon"""
+        """Check if a PEM-only certificate (e.g. an imported one) is valid and not expiring soon"""
         try:
-            cert = x509.load_pem_x509_certificate(cert_pem.encode('utf-8'))
-            now = datetime.utcnow()
-            expiry_threshold = now + timedelta(days=days_ahead)
+            not_valid_after = _certificate_not_valid_after(cert_pem)
+            expiry_threshold = datetime.utcnow() + timedelta(days=days_ahead)
 
-            return cert.not_valid_after > expiry_threshold
+            return not_valid_after > expiry_threshold
         except Exception as e:
             logger.error(f"Error validating certificate: {e}")
             return False
 
-    def _parse_ip_address(self, address: str):
-        """Parse IP address for SAN extension"""
-        try:
-            import ipaddress
-            return ipaddress.ip_address(address)
-        except ValueError:
-            # If not an IP, use localhost
-            return ipaddress.ip_address("127.0.0.1")
-
     def _build_san_list(self, node_name: str, node_address: str) -> list:
         """Build Subject Alternative Names list for node certificates"""
-        san_list = []
-
         # Always include the node name as DNS
-        san_list.append(x509.DNSName(node_name))
+        san_list = [x509.DNSName(node_name)]
 
-        # Try to parse node_address as IP first
+        # An address that isn't an IP literal is a hostname; it must not map to loopback
         try:
-            ip_addr = self._parse_ip_address(node_address)
-            san_list.append(x509.IPAddress(ip_addr))
-
-            # If node_address is different from node_name, add it as DNS too
-            if node_address != node_name:
-                san_list.append(x509.DNSName(node_address))
+            ip_addr = ipaddress.ip_address(node_address)
+        except ValueError:
+            ip_addr = None
 
-        except Exception:
-            # If IP parsing fails, treat as DNS name
-            if node_address != node_name:
-                san_list.append(x509.DNSName(node_address))
+        if ip_addr is not None:
+            if ip_addr != _LOCALHOST_V4:
+                san_list.append(x509.IPAddress(ip_addr))
+        elif node_address not in (node_name, "localhost"):
+            san_list.append(x509.DNSName(node_address))
 
         # Add common localhost entries for development
-        try:
-            import ipaddress
-            san_list.append(x509.IPAddress(ipaddress.IPv4Address('127.0.0.1')))
-            san_list.append(x509.DNSName('localhost'))
-        except Exception:
-            pass
+        san_list.append(_LOCALHOST_V4_SAN)
+        if node_name != "localhost":
+            san_list.append(_LOCALHOST_DNS)
 
         return san_list
\ No newline at end of file
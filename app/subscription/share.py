@@ -1,19 +1,25 @@
-import base64
-import json # For logging dicts
 import logging
-import secrets
-from collections import defaultdict
+import random
+import string
+import time
 from datetime import datetime as dt
-from datetime import timedelta
-from typing import TYPE_CHECKING, List, Literal, Union, Optional, Dict, Any
-
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+import orjson
+try:
+    import pybase64 as base64 # SIMD encoder; subscription bodies can be large
+except ImportError:
+    import base64
 from jdatetime import date as jd # type: ignore
 
 # Ensure xray, logger are available. If xray.config or xray.hosts are not yet populated
 # when this module loads, their usage in functions must be robust.
 from app import xray
+from app.utils.store import TTLStorage
 from app.utils.system import get_public_ip, get_public_ipv6, readable_size
 from app.models.proxy import ProxyTypes, ShadowsocksSettings
+from app.models.user import UserResponse, UserStatus
 from app.db import crud as db_crud # For fetching node details
 from app.db import SessionLocal # To get a DB session if needed
 
@@ -23,10 +29,6 @@ from .singbox import SingBoxConfiguration
 from .outline import OutlineConfiguration
 from .clash import ClashConfiguration, ClashMetaConfiguration
 
-if TYPE_CHECKING:
-    from app.models.user import UserResponse
-    # from app.db.models import ProxyHost as DBProxyHost # No longer used
-
 from config import (
     ACTIVE_STATUS_TEXT,
     DISABLED_STATUS_TEXT,
@@ -35,8 +37,48 @@ from config import (
     ONHOLD_STATUS_TEXT,
 )
 
-SERVER_IP = get_public_ip()
-SERVER_IPV6 = get_public_ipv6()
+logger = logging.getLogger("marzban")
+
+# Public addresses are looked up on first use rather than at import, and refreshed after a while
+_public_addresses = TTLStorage(default_ttl=6 * 3600, max_size=2)
+
+
+def server_ip() -> str:
+    ip = _public_addresses.get("ipv4")
+    if ip is None:
+        ip = get_public_ip() or ""
+        _public_addresses.set("ipv4", ip)
+    return ip
+
+
+def server_ipv6() -> str:
+    ip = _public_addresses.get("ipv6")
+    if ip is None:
+        ip = get_public_ipv6() or ""
+        _public_addresses.set("ipv6", ip)
+    return ip
+
+
+# Node id -> (address, name); read on every subscription render but changed only through the node API
+node_details_cache = TTLStorage(default_ttl=300, max_size=512)
+
+# Rendered subscriptions; clients poll every few seconds and the body only changes with the user's
+# state, the node or the format. Entries also carry a fingerprint of everything the body is built
+# from on the user (credentials, inbounds, format fields) plus the XRay inbound maps version, so
+# writes that skip invalidation (bot, CLI, scheduled jobs) still re-render.
+subscription_cache = TTLStorage(default_ttl=15, max_size=4096)
+
+_ON_HOLD = UserStatus.on_hold.value
+
+# Upper-cased protocol names used in link remarks
+_PROTOCOL_LABELS = {protocol: protocol.value.upper() for protocol in ProxyTypes}
+
+# Wildcard SNI labels only need to be unpredictable enough to vary per link, not to be secret;
+# one urandom-seeded generator avoids a urandom syscall per link
+_sni_rng = random.Random()
+
+# Listen addresses that can't be handed to clients as a link address
+_UNROUTABLE_LISTENS = frozenset({"0.0.0.0", "127.0.0.1", "::", "", None})
 
 STATUS_EMOJIS = {
     "active": "✅", "expired": "⌛️", "limited": "🪫",
@@ -51,44 +93,54 @@ STATUS_TEXTS = {
 # --- Helper functions (generate_v2ray_links, etc.) remain the same ---
 # They all call process_inbounds_and_tags, which is what we're modifying.
 
-def generate_v2ray_links(proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, active_node_id: Optional[int]) -> list:
-    format_variables = setup_format_variables(extra_data)
+def generate_v2ray_links(proxies: dict, inbounds: dict, extra_data: Optional[dict], reverse: bool, active_node_id: Optional[int],
+                         format_variables: Optional[dict] = None) -> list:
+    if format_variables is None:
+        format_variables = setup_format_variables(extra_data)
     conf = V2rayShareLink()
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf, reverse, active_node_id) # type: ignore
 
 # ... (generate_clash_subscription, generate_singbox_subscription, etc. are similar)
 def generate_clash_subscription(
-        proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, active_node_id: Optional[int], is_meta: bool = False
+        proxies: dict, inbounds: dict, extra_data: Optional[dict], reverse: bool, active_node_id: Optional[int], is_meta: bool = False,
+        format_variables: Optional[dict] = None
 ) -> str:
     if is_meta:
         conf = ClashMetaConfiguration()
     else:
         conf = ClashConfiguration()
-    format_variables = setup_format_variables(extra_data)
+    if format_variables is None:
+        format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf, reverse, active_node_id) # type: ignore
 
 
 def generate_singbox_subscription(
-        proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, active_node_id: Optional[int]
+        proxies: dict, inbounds: dict, extra_data: Optional[dict], reverse: bool, active_node_id: Optional[int],
+        format_variables: Optional[dict] = None
 ) -> str:
     conf = SingBoxConfiguration()
-    format_variables = setup_format_variables(extra_data)
+    if format_variables is None:
+        format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf, reverse, active_node_id) # type: ignore
 
 
 def generate_outline_subscription(
-        proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, active_node_id: Optional[int]
+        proxies: dict, inbounds: dict, extra_data: Optional[dict], reverse: bool, active_node_id: Optional[int],
+        format_variables: Optional[dict] = None
 ) -> str:
     conf = OutlineConfiguration()
-    format_variables = setup_format_variables(extra_data)
+    if format_variables is None:
+        format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf, reverse, active_node_id) # type: ignore
 
 
 def generate_v2ray_json_subscription(
-        proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, active_node_id: Optional[int]
+        proxies: dict, inbounds: dict, extra_data: Optional[dict], reverse: bool, active_node_id: Optional[int],
+        format_variables: Optional[dict] = None
 ) -> str:
     conf = V2rayJsonConfig()
-    format_variables = setup_format_variables(extra_data)
+    if format_variables is None:
+        format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf, reverse, active_node_id) # type: ignore
 
 
@@ -99,20 +151,31 @@ def generate_subscription(
         as_base64: bool,
         reverse: bool,
         active_node_id_override: Optional[int] = None
-) -> str:
+) -> Union[str, bytes]:
     # Use the node ID from the override if provided, otherwise from the user object
     # This assumes user.active_node_id is correctly populated by UserResponse.build_dynamic_fields
     current_active_node_id = active_node_id_override if active_node_id_override is not None else user.active_node_id
 
     # Convert SQLAlchemy User to UserResponse if needed
     if not isinstance(user, UserResponse):
-        from app.models.user import UserResponse
         user = UserResponse.model_validate(user)
 
+    cache_key = f"{user.account_number.lower()}:{current_active_node_id}:{config_format}:{int(as_base64)}:{int(reverse)}"
+    fingerprint = (
+        tuple(getattr(user, field) for field in FORMAT_VARIABLE_FIELDS),
+        user.proxies,
+        user.inbounds,
+        xray.config.maps_version,
+    )
+    cached = subscription_cache.get(cache_key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
     kwargs = {
         "proxies": user.proxies,
         "inbounds": user.inbounds, # This is Dict[ProxyTypes, List[str_tags]]
-        "extra_data": user.model_dump(exclude_none=True), # Get full user data as dict
+        "extra_data": None,
+        "format_variables": user_format_variables(user), # Only one format is rendered, so build these once
         "reverse": reverse,
         "active_node_id": current_active_node_id
     }
@@ -135,9 +198,21 @@ def generate_subscription(
         raise ValueError(f'Unsupported format "{config_format}"')
 
     if as_base64:
-        config_str = base64.b64encode(config_str.encode()).decode()
+        # The HTTP router hands this to a Response, which wants bytes; the CLI decodes it itself
+        config_str = base64.b64encode(config_str.encode())
+    subscription_cache.set(cache_key, (fingerprint, config_str))
     return config_str
 
+
+def invalidate_user_subscriptions(account_number: str) -> None:
+    """Drop a user's rendered subscriptions after the user is modified, reset, revoked or removed."""
+    subscription_cache.delete_prefix(f"{account_number.lower()}:")
+
+
+def invalidate_all_subscriptions() -> None:
+    """Drop every rendered subscription after a host, node service or XRay config change."""
+    subscription_cache.clear()
+
 # --- format_time_left and setup_format_variables remain the same ---
 def format_time_left(seconds_left: int) -> str:
     if not seconds_left or seconds_left <= 0:
@@ -154,31 +229,110 @@ def format_time_left(seconds_left: int) -> str:
     if not result and seconds_left > 0 : result.append(f"{int(seconds_left)}s")
     return " ".join(result) if result else "0s"
 
+# The only user fields setup_format_variables reads
+FORMAT_VARIABLE_FIELDS = ("account_number", "status", "expire", "on_hold_expire_duration", "data_limit", "used_traffic")
+
+
+def user_format_variables(user) -> dict:
+    """setup_format_variables for a user object without dumping the whole model."""
+    return setup_format_variables({
+        field: value for field in FORMAT_VARIABLE_FIELDS
+        if (value := getattr(user, field, None)) is not None
+    })
+
+
+class FormatVariables(dict):
+    """Format variables for remarks and paths; unknown keys format as "".
+
+    The server's public addresses need network lookups, so they are only resolved
+    when a template actually uses them.
+    """
+
+    def __missing__(self, key):
+        if key == "SERVER_IP":
+            return server_ip()
+        if key == "SERVER_IPV6":
+            return server_ipv6()
+        return ""
+
+
+# Expire timestamp -> (gregorian, jalali) date strings; jdatetime's calendar math is pure Python
+_expire_date_cache: Dict[int, Tuple[str, str]] = {}
+_EXPIRE_DATE_CACHE_SIZE = 4096
+
+
+def expire_date_strings(expire_timestamp: int) -> Tuple[str, str]:
+    # Keyed on the exact timestamp: the local date depends on the server timezone, not on UTC days
+    dates = _expire_date_cache.get(expire_timestamp)
+    if dates is None:
+        expire_datetime = dt.fromtimestamp(expire_timestamp)
+        expire_date_str = expire_datetime.strftime("%Y-%m-%d")
+        try:
+            jalali_expire_date_str = jd.fromgregorian(date=expire_datetime.date()).strftime("%Y-%m-%d")
+        except Exception: jalali_expire_date_str = expire_date_str
+        if len(_expire_date_cache) >= _EXPIRE_DATE_CACHE_SIZE:
+            _expire_date_cache.pop(next(iter(_expire_date_cache)))
+        dates = _expire_date_cache[expire_timestamp] = (expire_date_str, jalali_expire_date_str)
+    return dates
+
+
+# Template string -> compiled renderer, or None when format_map has to handle it
+_compiled_templates: Dict[str, Optional[Tuple[Tuple[str, Optional[str]], ...]]] = {}
+_COMPILED_TEMPLATES_SIZE = 1024
+_formatter = string.Formatter()
+
+
+def _compile_template(template: str) -> Optional[Tuple[Tuple[str, Optional[str]], ...]]:
+    """Parse a template once into (literal, key) parts; key is None for a trailing literal."""
+    try:
+        parsed = list(_formatter.parse(template))
+    except ValueError:
+        return None
+    parts = []
+    for literal, field, spec, conversion in parsed:
+        # Positional, attribute, index, conversion and spec fields keep format_map's exact semantics
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            return None
+        parts.append((literal, field))
+    return tuple(parts)
+
+
+def format_template(template: str, format_variables: dict) -> str:
+    """``template.format_map(format_variables)`` with the template parsed once per distinct string."""
+    if '{' not in template:
+        return template
+    try:
+        parts = _compiled_templates[template]
+    except KeyError:
+        if len(_compiled_templates) >= _COMPILED_TEMPLATES_SIZE:
+            _compiled_templates.pop(next(iter(_compiled_templates)))
+        parts = _compiled_templates[template] = _compile_template(template)
+    if parts is None:
+        return template.format_map(format_variables)
+    return "".join(
+        literal if key is None else literal + format(format_variables[key])
+        for literal, key in parts
+    )
+
+
 def setup_format_variables(extra_data: dict) -> dict:
-    from app.models.user import UserStatus
     user_status_val = extra_data.get("status")
     expire_timestamp = extra_data.get("expire")
     on_hold_expire_duration = extra_data.get("on_hold_expire_duration")
-    now = dt.utcnow()
-    now_ts = now.timestamp()
+    now_ts = int(time.time())
     days_left_str = "∞"; time_left_str = "∞"; expire_date_str = "∞"; jalali_expire_date_str = "∞"
 
-    if user_status_val != UserStatus.on_hold.value:
+    if user_status_val != _ON_HOLD:
         if expire_timestamp is not None and expire_timestamp >= 0:
-            seconds_left = expire_timestamp - int(now_ts)
-            expire_datetime = dt.fromtimestamp(expire_timestamp)
-            expire_date_str = expire_datetime.strftime("%Y-%m-%d")
-            try:
-                jalali_expire_date_str = jd.fromgregorian(date=expire_datetime.date()).strftime("%Y-%m-%d")
-            except Exception: jalali_expire_date_str = expire_date_str
+            seconds_left = expire_timestamp - now_ts
+            expire_date_str, jalali_expire_date_str = expire_date_strings(expire_timestamp)
             if seconds_left > 0 :
-                days_left_val = (expire_datetime - now).days
-                days_left_str = str(days_left_val + 1) if days_left_val >=0 else "0"
+                days_left_str = str(seconds_left // 86400 + 1)
                 time_left_str = format_time_left(seconds_left)
             else: days_left_str = "0"; time_left_str = "0s"
     else:
         if on_hold_expire_duration is not None and on_hold_expire_duration > 0:
-            days_left_str = str(timedelta(seconds=on_hold_expire_duration).days)
+            days_left_str = str(int(on_hold_expire_duration) // 86400)
             time_left_str = format_time_left(on_hold_expire_duration)
             expire_date_str = "-"; jalali_expire_date_str = "-"
     data_limit_str = "∞"; data_left_str = "∞"
@@ -191,8 +345,7 @@ def setup_format_variables(extra_data: dict) -> dict:
         data_limit_str = readable_size(0); data_left_str = readable_size(0)
     status_emoji = STATUS_EMOJIS.get(user_status_val, ""); status_text = STATUS_TEXTS.get(user_status_val, "")
     account_number = extra_data.get("account_number", "{ACCOUNT_NUMBER}")
-    return defaultdict(lambda: "", {
-        "SERVER_IP": SERVER_IP or "", "SERVER_IPV6": SERVER_IPV6 or "",
+    return FormatVariables({
         "USERNAME": account_number, "ACCOUNT_NUMBER": account_number,
         "DATA_USAGE": readable_size(extra_data.get("used_traffic", 0)),
         "DATA_LIMIT": data_limit_str, "DATA_LEFT": data_left_str,
@@ -202,6 +355,52 @@ def setup_format_variables(extra_data: dict) -> dict:
     })
 
 
+def get_node_details(node_id: int) -> Optional[Tuple[str, str]]:
+    """(public address, name) of a node, or None if it doesn't exist."""
+    details = node_details_cache.get(node_id)
+    if details is None:
+        db = SessionLocal()
+        try:
+            dbnode = db_crud.get_node_by_id(db, node_id)
+        finally:
+            db.close()
+        if not dbnode:
+            return None
+        details = (dbnode.address, dbnode.name)
+        node_details_cache.set(node_id, details)
+    return details
+
+
+def invalidate_node_details(node_id: int) -> None:
+    """Drop a node's cached details after it is modified or removed."""
+    node_details_cache.delete(node_id)
+    # Rendered subscriptions embed the node's name and address; node edits are rare
+    invalidate_all_subscriptions()
+
+
+@lru_cache(maxsize=256)
+def _sorted_inbound_tags(
+        user_inbounds: Tuple[Tuple[ProxyTypes, Tuple[str, ...]], ...],
+        maps_version: int,
+) -> Tuple[Tuple[ProxyTypes, str], ...]:
+    """(protocol, tag) pairs in global XRay config order; tags not in the config go last.
+
+    Users share a handful of inbound layouts, so the sort runs once per layout and config version.
+    The running position keeps the sort stable and means protocols are never compared.
+    """
+    global_inbound_order_map = xray.config.inbound_order
+    unknown_rank = len(global_inbound_order_map)
+    ranked = sorted(
+        (global_inbound_order_map.get(tag_name, unknown_rank), position, protocol_enum, tag_name)
+        for position, (protocol_enum, tag_name) in enumerate(
+            (protocol_enum, tag_name)
+            for protocol_enum, tags_for_protocol in user_inbounds
+            for tag_name in tags_for_protocol
+        )
+    )
+    return tuple((protocol_enum, tag_name) for _, _, protocol_enum, tag_name in ranked)
+
+
 def process_inbounds_and_tags(
         user_inbounds: Dict[ProxyTypes, List[str]], # e.g., {ProxyTypes.VLESS: ['marzban_service_1']}
         user_proxies: Dict[ProxyTypes, Any],       # e.g., {ProxyTypes.VLESS: VLESSSettingsModelInstance}
@@ -214,89 +413,82 @@ def process_inbounds_and_tags(
         active_node_id: Optional[int]
 ) -> Union[List, str]:
 
-    # Use the main app logger or a specific one for this module
-    _logger = logging.getLogger(f"{__name__}.process_inbounds_and_tags") # More specific
-    logging.getLogger("marzban").info(f"Processing inbounds for user {format_variables.get('ACCOUNT_NUMBER', 'N/A')}, active_node_id: {active_node_id}")
-    logging.getLogger("marzban").debug(f"Received user_inbounds: {user_inbounds}")
-    logging.getLogger("marzban").debug(f"Received user_proxies keys: {[k.value for k in user_proxies.keys()] if user_proxies else 'None'}")
-
-    if not xray.config or not xray.config.inbounds_by_tag:
-        logging.getLogger("marzban").error("Global xray.config or xray.config.inbounds_by_tag is not loaded/available. Cannot generate links.")
+    # Preconditions first, so misconfigured nodes and users without inbounds return before any log
+    # strings are built; these messages are constants.
+    inbounds_by_tag = getattr(xray.config, 'inbounds_by_tag', None)
+    if not inbounds_by_tag:
+        logger.error("Global xray.config or xray.config.inbounds_by_tag is not loaded/available. Cannot generate links.")
         return conf.render(reverse=reverse) # type: ignore
-
-    logging.getLogger("marzban").debug(f"Available global XRay inbound tags (xray.config.inbounds_by_tag.keys()): {list(xray.config.inbounds_by_tag.keys())}")
-
-    all_user_tags_with_protocol = []
     if not user_inbounds:
-        logging.getLogger("marzban").warning("User has no specific inbounds (user_inbounds map is empty). No links will be generated.")
+        logger.warning("User has no specific inbounds (user_inbounds map is empty). No links will be generated.")
         return conf.render(reverse=reverse) # type: ignore
 
-    for protocol_enum, tags_for_protocol in user_inbounds.items():
-        for tag_name in tags_for_protocol:
-            all_user_tags_with_protocol.append({'protocol': protocol_enum, 'tag': tag_name})
-
-    if not all_user_tags_with_protocol:
-        logging.getLogger("marzban").warning("No tags to process after parsing user_inbounds. No links generated.")
-        return conf.render(reverse=reverse) # type: ignore
+    # Checked once: the debug lines below build f-strings and JSON dumps even when DEBUG is off
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("Processing inbounds for user %s, active_node_id: %s", format_variables.get('ACCOUNT_NUMBER', 'N/A'), active_node_id)
+        logger.debug(f"Received user_inbounds: {user_inbounds}")
+        logger.debug(f"Received user_proxies keys: {[k.value for k in user_proxies.keys()] if user_proxies else 'None'}")
 
-    logging.getLogger("marzban").debug(f"Total tags to process for user: {all_user_tags_with_protocol}")
+    if debug:
+        logger.debug(f"Available global XRay inbound tags (xray.config.inbounds_by_tag.keys()): {list(inbounds_by_tag.keys())}")
 
-    # Sorting based on global XRay config order (if still desired)
-    global_inbound_order_map = {tag: index for index, tag in enumerate(xray.config.inbounds_by_tag.keys())}
-    sorted_user_tags_with_protocol = sorted(
-        all_user_tags_with_protocol,
-        key=lambda x: global_inbound_order_map.get(x['tag'], float('inf')) # Tags not in global config go last
+    sorted_user_tags_with_protocol = _sorted_inbound_tags(
+        tuple((protocol_enum, tuple(tags_for_protocol)) for protocol_enum, tags_for_protocol in user_inbounds.items()),
+        xray.config.maps_version,
     )
-    logging.getLogger("marzban").debug(f"Sorted tags for processing: {sorted_user_tags_with_protocol}")
+
+    if not sorted_user_tags_with_protocol:
+        logger.warning("No tags to process after parsing user_inbounds. No links generated.")
+        return conf.render(reverse=reverse) # type: ignore
+
+    if debug:
+        logger.debug(f"Sorted tags for processing: {[(p.value, t) for p, t in sorted_user_tags_with_protocol]}")
 
 
     node_public_address = None
     node_name_for_remark = "Server" # Default remark node name
 
     if active_node_id is not None:
-        # Fetch active node's details (especially its public FQDN or IP)
-        # This requires a DB session.
-        db_for_node_fetch = SessionLocal()
-        try:
-            active_node_orm = db_crud.get_node_by_id(db_for_node_fetch, active_node_id)
-            if active_node_orm:
-                # Assuming Node model has an 'address' field for its public FQDN/IP
-                # And a 'name' field for remarks.
-                node_public_address = active_node_orm.address
-                node_name_for_remark = active_node_orm.name
-                logging.getLogger("marzban").info(f"  Fetched active node {active_node_id}: Name='{node_name_for_remark}', PublicAddress='{node_public_address}'")
-                if not node_public_address:
-                    logging.getLogger("marzban").warning(f"  Active node {active_node_id} ('{node_name_for_remark}') has no public address configured. Link generation may fail or use fallbacks.")
-            else:
-                logging.getLogger("marzban").error(f"  Active node with ID {active_node_id} not found in database. Cannot determine public address for links.")
-                return conf.render(reverse=reverse) # type: ignore
-        finally:
-            db_for_node_fetch.close()
+        # Node address and name are cached, so most renders don't touch the DB
+        node_details = get_node_details(active_node_id)
+        if node_details:
+            node_public_address, node_name_for_remark = node_details
+            if debug:
+                logger.debug("  Fetched active node %s: Name='%s', PublicAddress='%s'", active_node_id, node_name_for_remark, node_public_address)
+            if not node_public_address:
+                logger.warning(f"  Active node {active_node_id} ('{node_name_for_remark}') has no public address configured. Link generation may fail or use fallbacks.")
+        else:
+            logger.error(f"  Active node with ID {active_node_id} not found in database. Cannot determine public address for links.")
+            return conf.render(reverse=reverse) # type: ignore
     else:
-        logging.getLogger("marzban").info("  No active_node_id provided; link generation will rely on global SERVER_IP or addresses within XRay config if public.")
-        # If no active_node_id, we might use a globally defined SERVER_IP or assume service listen address is public.
+        logger.debug("  No active_node_id provided; link generation will rely on the server's public IP or addresses within XRay config if public.")
+        # If no active_node_id, we might use the server's public IP or assume service listen address is public.
         # This path is less common if users always activate specific nodes.
-        node_public_address = SERVER_IP # Fallback, or handle as error if specific node address is always expected
-
+        node_public_address = server_ip() # Fallback, or handle as error if specific node address is always expected
 
-    for item_idx, item_data in enumerate(sorted_user_tags_with_protocol):
-        protocol_enum: ProxyTypes = item_data['protocol']
-        service_tag_name: str = item_data['tag'] # e.g., 'marzban_service_1'
+    # Settings are per protocol, not per tag; dump each one once and share it (conf.add only reads it)
+    settings_dicts: Dict[ProxyTypes, dict] = {}
+    links_added = 0
 
-        logging.getLogger("marzban").info(f"  Processing user's service tag {item_idx + 1}/{len(sorted_user_tags_with_protocol)}: Protocol='{protocol_enum.value}', Tag='{service_tag_name}' for NodeID={active_node_id}")
+    for item_idx, (protocol_enum, service_tag_name) in enumerate(sorted_user_tags_with_protocol):
+        if debug:
+            logger.debug("  Processing user's service tag %d/%d: Protocol='%s', Tag='%s' for NodeID=%s",
+                         item_idx + 1, len(sorted_user_tags_with_protocol), protocol_enum.value, service_tag_name, active_node_id)
 
         user_protocol_settings = user_proxies.get(protocol_enum)
         if not user_protocol_settings:
-            logging.getLogger("marzban").warning(f"    User {format_variables.get('ACCOUNT_NUMBER')} missing proxy settings for protocol {protocol_enum.value}. Skipping tag '{service_tag_name}'.")
+            logger.warning(f"    User {format_variables.get('ACCOUNT_NUMBER')} missing proxy settings for protocol {protocol_enum.value}. Skipping tag '{service_tag_name}'.")
             continue
 
         # Get the full XRay inbound configuration for this specific tag from the panel's loaded XRay config
         # This 'actual_xray_inbound_config' is the source of truth for ports, paths, SNI from XRay's perspective.
-        actual_xray_inbound_config = xray.config.inbounds_by_tag.get(service_tag_name)
+        actual_xray_inbound_config = inbounds_by_tag.get(service_tag_name)
         if not actual_xray_inbound_config:
-            logging.getLogger("marzban").warning(f"    Service tag '{service_tag_name}' (for user protocol {protocol_enum.value}) not found in the panel's loaded XRay configuration (xray.config.inbounds_by_tag). Skipping.")
+            logger.warning(f"    Service tag '{service_tag_name}' (for user protocol {protocol_enum.value}) not found in the panel's loaded XRay configuration (xray.config.inbounds_by_tag). Skipping.")
             continue
-        logging.getLogger("marzban").debug(f"    Found XRay inbound config for tag '{service_tag_name}': Port={actual_xray_inbound_config.get('port')}, Listen='{actual_xray_inbound_config.get('listen')}'")
+        if debug:
+            logger.debug(f"    Found XRay inbound config for tag '{service_tag_name}': Port={actual_xray_inbound_config.get('port')}, Listen='{actual_xray_inbound_config.get('listen')}'")
 
 
         # Determine the final public address for the link
@@ -304,82 +496,64 @@ def process_inbounds_and_tags(
         if not final_link_address:
             # If node address wasn't found, try fallback to XRay listen address ONLY if it's not a bind-all/localhost
             xray_listen_addr = actual_xray_inbound_config.get("listen", "0.0.0.0")
-            if xray_listen_addr and xray_listen_addr not in ["0.0.0.0", "127.0.0.1", "::"]:
+            if xray_listen_addr not in _UNROUTABLE_LISTENS:
                 final_link_address = xray_listen_addr
-                logging.getLogger("marzban").info(f"    Using XRay listen address '{xray_listen_addr}' as public address for tag '{service_tag_name}' (node public address was not available).")
+                logger.info(f"    Using XRay listen address '{xray_listen_addr}' as public address for tag '{service_tag_name}' (node public address was not available).")
             else:
-                logging.getLogger("marzban").error(f"    Cannot determine a public address for tag '{service_tag_name}' (NodeID: {active_node_id}, NodeAddr: {node_public_address}, XRayListen: {xray_listen_addr}). Skipping link generation for this tag.")
+                logger.error(f"    Cannot determine a public address for tag '{service_tag_name}' (NodeID: {active_node_id}, NodeAddr: {node_public_address}, XRayListen: {xray_listen_addr}). Skipping link generation for this tag.")
                 continue
 
         final_link_port = actual_xray_inbound_config.get("port") # Port should come from XRay config
 
-        # Prepare `link_specific_details` from `actual_xray_inbound_config`
-        link_specific_details = actual_xray_inbound_config.copy() # Includes port, protocol, settings, streamSettings
-        stream_settings = link_specific_details.get("streamSettings", {})
-
-        logging.getLogger("marzban").debug(f"    Actual XRay inbound config for tag '{service_tag_name}':")
-        logging.getLogger("marzban").debug(f"      Full config: {json.dumps(actual_xray_inbound_config, default=str, indent=2)}")
-        logging.getLogger("marzban").debug(f"      Stream settings: {json.dumps(stream_settings, default=str, indent=2)}")
-
-        # Extract and format SNI, Path, Host header for the link generation classes
-        link_specific_details['sni'] = stream_settings.get("tlsSettings", {}).get("serverName") or \
-                                       stream_settings.get("realitySettings", {}).get("serverName", "")
-        if '*' in link_specific_details['sni']:
-            link_specific_details['sni'] = link_specific_details['sni'].replace("*", secrets.token_hex(8))
-
-        link_specific_details['host'] = stream_settings.get("wsSettings", {}).get("headers", {}).get("Host") or \
-                                        stream_settings.get("httpSettings", {}).get("headers", {}).get("Host", "") # For HTTP/2 upg.
-
-        # Extract network type from stream settings
-        network_type = stream_settings.get("network", "tcp")
-        link_specific_details['network'] = network_type
-        logging.getLogger("marzban").debug(f"      Network type: {network_type}")
-
-        # Set header_type based on network type and stream settings
-        if network_type == "ws":
-            link_specific_details['header_type'] = "none"
-        elif network_type == "tcp":
-            link_specific_details['header_type'] = stream_settings.get("tcpSettings", {}).get("header", {}).get("type", "none")
-        elif network_type == "grpc":
-            link_specific_details['header_type'] = "grpc"
-        else:
-            link_specific_details['header_type'] = "none"
-        logging.getLogger("marzban").debug(f"      Header type: {link_specific_details['header_type']}")
-
-        # Add TLS settings
-        link_specific_details['tls'] = stream_settings.get("security", "") # 'tls', 'reality', or empty
-        link_specific_details['fp'] = stream_settings.get("tlsSettings", {}).get("fingerprint") or \
-                                      stream_settings.get("realitySettings", {}).get("fingerprint", "")
-        link_specific_details['alpn'] = stream_settings.get("tlsSettings", {}).get("alpn", []) # Default to empty list if not present
-
-        path_val = ""
-        if network_type == "ws" and stream_settings.get("wsSettings"):
-            path_val = stream_settings["wsSettings"].get("path", "")
-        elif network_type == "grpc" and stream_settings.get("grpcSettings"):
-            path_val = stream_settings["grpcSettings"].get("serviceName", "")
-        # Apply formatting to path if it uses variables (less common for direct XRay config values)
-        link_specific_details['path'] = path_val.format_map(format_variables) if path_val else ""
-        logging.getLogger("marzban").debug(f"      Path: {link_specific_details['path']}")
+        # Per-tag view precomputed when the XRay config was loaded. The renderers only read it, so it
+        # is copied only when a wildcard SNI or a templated path has to be rewritten for this link.
+        link_specific_details = xray.config.link_inbounds_by_tag[service_tag_name]
 
-        logging.getLogger("marzban").debug(f"      Final link_specific_details: {json.dumps(link_specific_details, default=str, indent=2)}")
+        if debug:
+            logger.debug(f"    Actual XRay inbound config for tag '{service_tag_name}':")
+            logger.debug(f"      Full config: {orjson.dumps(actual_xray_inbound_config, default=str).decode()}")
+            logger.debug(f"      Stream settings: {orjson.dumps(link_specific_details.get('streamSettings', {}), default=str).decode()}")
 
-        remark_str = f"{node_name_for_remark} - {protocol_enum.value.upper()}"
+        sni_val = link_specific_details['sni']
+        path_val = link_specific_details['path']
+        rewrite_sni = '*' in sni_val
+        # Apply formatting to path if it uses variables (less common for direct XRay config values)
+        rewrite_path = '{' in path_val
+        if rewrite_sni or rewrite_path:
+            link_specific_details = dict(link_specific_details)
+            # A wildcard SNI gets a fresh random label per link
+            if rewrite_sni:
+                link_specific_details['sni'] = sni_val.replace("*", _sni_rng.randbytes(8).hex())
+            if rewrite_path:
+                link_specific_details['path'] = format_template(path_val, format_variables)
+        if debug:
+            logger.debug(f"      Network type: {link_specific_details['network']}")
+            logger.debug(f"      Header type: {link_specific_details['header_type']}")
+            logger.debug(f"      Path: {link_specific_details['path']}")
+            logger.debug(f"      Final link_specific_details: {orjson.dumps(link_specific_details, default=str).decode()}")
+
+        # Only the node name can carry format variables
+        remark_node_name = format_template(node_name_for_remark, format_variables)
+        protocol_label = _PROTOCOL_LABELS[protocol_enum]
+        remark_str = f"{remark_node_name} - {protocol_label}"
         if format_variables.get("ACCOUNT_NUMBER"): # Add user identifier to remark
-            remark_str = f"{format_variables['ACCOUNT_NUMBER']}@{node_name_for_remark} - {protocol_enum.value.upper()}"
-        remark_str = remark_str.format_map(format_variables) # Apply any other remark formatting
+            remark_str = f"{format_variables['ACCOUNT_NUMBER']}@{remark_node_name} - {protocol_label}"
 
 
-        user_protocol_settings_dict = user_protocol_settings.model_dump(exclude_none=True)
-        if isinstance(user_protocol_settings, ShadowsocksSettings): # Ensure enum values are strings
-            if 'method' in user_protocol_settings_dict and hasattr(user_protocol_settings_dict['method'], 'value'):
-                user_protocol_settings_dict['method'] = user_protocol_settings_dict['method'].value
+        user_protocol_settings_dict = settings_dicts.get(protocol_enum)
+        if user_protocol_settings_dict is None:
+            user_protocol_settings_dict = settings_dicts[protocol_enum] = user_protocol_settings.model_dump(exclude_none=True)
+            if isinstance(user_protocol_settings, ShadowsocksSettings): # Ensure enum values are strings
+                if 'method' in user_protocol_settings_dict and hasattr(user_protocol_settings_dict['method'], 'value'):
+                    user_protocol_settings_dict['method'] = user_protocol_settings_dict['method'].value
 
-        logging.getLogger("marzban").debug(f"    Final components for conf.add for tag '{service_tag_name}':")
-        logging.getLogger("marzban").debug(f"      Remark: '{remark_str}'")
-        logging.getLogger("marzban").debug(f"      Address: '{final_link_address}'")
-        logging.getLogger("marzban").debug(f"      Port: {final_link_port}") # Port is part of link_specific_details from XRay config
-        logging.getLogger("marzban").debug(f"      User Protocol Settings (passed as 'settings'): {user_protocol_settings_dict}")
-        logging.getLogger("marzban").debug(f"      Link Specific Details (passed as 'inbound'): {json.dumps(link_specific_details, default=str, indent=2)}")
+        if debug:
+            logger.debug(f"    Final components for conf.add for tag '{service_tag_name}':")
+            logger.debug(f"      Remark: '{remark_str}'")
+            logger.debug(f"      Address: '{final_link_address}'")
+            logger.debug(f"      Port: {final_link_port}") # Port is part of link_specific_details from XRay config
+            logger.debug(f"      User Protocol Settings (passed as 'settings'): {user_protocol_settings_dict}")
+            logger.debug(f"      Link Specific Details (passed as 'inbound'): {orjson.dumps(link_specific_details, default=str).decode()}")
 
 
         try:
@@ -391,17 +565,18 @@ def process_inbounds_and_tags(
                 inbound=link_specific_details,   # This now carries port, sni, path, host, tls, fp etc from actual_xray_inbound_config
                 settings=user_protocol_settings_dict # User's VLESS id, SS pass/method etc.
             )
-            logging.getLogger("marzban").info(f"    Successfully added configuration for tag '{service_tag_name}' to subscription builder.")
+            links_added += 1
         except Exception as e_add:
-            logging.getLogger("marzban").error(f"    Error adding config for tag '{service_tag_name}', remark '{remark_str}': {e_add}", exc_info=True)
+            logger.error(f"    Error adding config for tag '{service_tag_name}', remark '{remark_str}': {e_add}", exc_info=True)
 
     rendered_config = conf.render(reverse=reverse) # type: ignore
     if isinstance(rendered_config, list) and not rendered_config:
-        logging.getLogger("marzban").warning(f"User {format_variables.get('ACCOUNT_NUMBER', 'N/A')}: conf.render() produced an empty list. No links were successfully added.")
+        logger.warning(f"User {format_variables.get('ACCOUNT_NUMBER', 'N/A')}: conf.render() produced an empty list. No links were successfully added.")
     elif isinstance(rendered_config, str) and not rendered_config.strip():
-         logging.getLogger("marzban").warning(f"User {format_variables.get('ACCOUNT_NUMBER', 'N/A')}: conf.render() produced an empty string. No config generated.")
+         logger.warning(f"User {format_variables.get('ACCOUNT_NUMBER', 'N/A')}: conf.render() produced an empty string. No config generated.")
     else:
-        logging.getLogger("marzban").info(f"User {format_variables.get('ACCOUNT_NUMBER', 'N/A')}: Successfully rendered subscription content.")
+        logger.info("User %s: Successfully rendered subscription content (%d of %d tags).",
+                    format_variables.get('ACCOUNT_NUMBER', 'N/A'), links_added, len(sorted_user_tags_with_protocol))
 
     return rendered_config
 
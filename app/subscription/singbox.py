@@ -2,7 +2,7 @@ import copy
 import json
 from random import choice
 
-from app.utils.helpers import UUIDEncoder
+import orjson
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun
@@ -66,7 +66,8 @@ class SingBoxConfiguration(str):
 
         if reverse:
             self.config["outbounds"].reverse()
-        return json.dumps(self.config, indent=4,cls=UUIDEncoder)
+        # orjson serializes UUIDs natively and is several times faster than json + UUIDEncoder
+        return orjson.dumps(self.config, option=orjson.OPT_INDENT_2).decode()
 
     @staticmethod
     def tls_config(sni=None, fp=None, tls=None, pbk=None,
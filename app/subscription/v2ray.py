@@ -7,11 +7,11 @@ from typing import Union
 from urllib.parse import quote
 from uuid import UUID
 
+import orjson
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun, get_grpc_multi
 from app.templates import render_template
-from app.utils.helpers import UUIDEncoder
 from config import (
     EXTERNAL_CONFIG,
     GRPC_USER_AGENT_TEMPLATE,
@@ -521,7 +521,8 @@ class V2rayJsonConfig(str):
     def render(self, reverse=False):
         if reverse:
             self.config.reverse()
-        return json.dumps(self.config, indent=4, cls=UUIDEncoder)
+        # orjson serializes UUIDs natively and is several times faster than json + UUIDEncoder
+        return orjson.dumps(self.config, option=orjson.OPT_INDENT_2).decode()
 
     @staticmethod
     def tls_config(sni=None, fp=None, alpn=None, ais: bool = False) -> dict:
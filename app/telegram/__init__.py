@@ -31,6 +31,7 @@ from .handlers.report import (  # noqa
     report_new_user,
     report_user_modification,
     report_user_deletion,
+    report_users_deletion,
     report_status_change,
     report_user_usage_reset,
     report_user_data_reset_by_next,
@@ -44,6 +45,7 @@ __all__ = [
     "report_new_user",
     "report_user_modification",
     "report_user_deletion",
+    "report_users_deletion",
     "report_status_change",
     "report_user_usage_reset",
     "report_user_data_reset_by_next",
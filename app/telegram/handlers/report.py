@@ -126,6 +126,26 @@ def report_user_deletion(username: str, by: str, admin: Admin = None):
     return report(chat_id=admin.telegram_id if admin and admin.telegram_id else None, text=text)
 
 
+def report_users_deletion(usernames: list, by: str, admin: Admin = None):
+    # One message per chunk keeps bulk deletions well under Telegram's 4096-char limit
+    for i in range(0, len(usernames), 50):
+        chunk = usernames[i:i + 50]
+        text = '''\
+🗑 <b>#Deleted</b> ({count})
+➖➖➖➖➖➖➖➖➖
+{usernames}
+➖➖➖➖➖➖➖➖➖
+<b>Belongs To :</b> <code>{belong_to}</code>
+<b>By</b> : <b>#{by}</b>\
+    '''.format(
+            count=len(chunk),
+            usernames="\n".join(f"<code>{escape_html(u)}</code>" for u in chunk),
+            belong_to=escape_html(admin.username) if admin else None,
+            by=escape_html(by),
+        )
+        report(chat_id=admin.telegram_id if admin and admin.telegram_id else None, text=text)
+
+
 def report_status_change(username: str, status: str, admin: Admin = None):
     _status = {
         'active': '✅ <b>#Activated</b>',
@@ -16,9 +16,12 @@ statuses = {
     UserStatus.on_hold: "🔌",
 }
 
+_TRAILING_DIGITS = re.compile(r'(\d+)$')
 
-def time_to_string(time: dt):
-    now = dt.now()
+
+def time_to_string(time: dt, now: Optional[dt] = None):
+    if now is None:
+        now = dt.now()
     if time < now:
         delta = now - time
         days = delta.days
@@ -54,10 +57,13 @@ def get_user_info_text(db_user: User, db: Session) -> str:
     data_left = readable_size(user.data_limit - user.used_traffic) if user.data_limit else "-"
     on_hold_timeout = user.on_hold_timeout.strftime("%Y-%m-%d") if user.on_hold_timeout else "-"
     on_hold_duration = user.on_hold_expire_duration // (24*60*60) if user.on_hold_expire_duration else None
-    expiry_date = dt.fromtimestamp(user.expire).date() if user.expire else "Never"
-    time_left = time_to_string(dt.fromtimestamp(user.expire)) if user.expire else "-"
-    online_at = time_to_string(user.online_at) if user.online_at else "-"
-    sub_updated_at = time_to_string(user.sub_updated_at) if user.sub_updated_at else "-"
+    # One clock reading and one expiry datetime for every relative time in the message
+    now = dt.now()
+    expire_at = dt.fromtimestamp(user.expire) if user.expire else None
+    expiry_date = expire_at.date() if expire_at else "Never"
+    time_left = time_to_string(expire_at, now) if expire_at else "-"
+    online_at = time_to_string(user.online_at, now) if user.online_at else "-"
+    sub_updated_at = time_to_string(user.sub_updated_at, now) if user.sub_updated_at else "-"
     if user.status == UserStatus.on_hold:
         expiry_text = f"⏰ <b>On Hold Duration:</b> <code>{on_hold_duration} days</code> (auto start at <code>{ on_hold_timeout}</code>)"
     else:
@@ -81,7 +87,7 @@ def get_user_info_text(db_user: User, db: Session) -> str:
 
 
 def get_number_at_end(username: str):
-    n = re.search(r'(\d+)$', username)
+    n = _TRAILING_DIGITS.search(username)
     if n:
         return n.group(1)
 
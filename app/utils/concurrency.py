@@ -1,8 +1,13 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
 from threading import Thread
 
 import anyio
 from fastapi import BackgroundTasks
 
+logger = logging.getLogger("marzban")
+
 
 def threaded_function(func):
     def wrapper(*args, **kwargs):
@@ -11,6 +16,20 @@ def threaded_function(func):
     return wrapper
 
 
+def pooled_function(executor: ThreadPoolExecutor):
+    """Like threaded_function, but runs calls on a shared bounded pool instead of a new thread each."""
+    def decorator(func):
+        def log_exception(future: Future):
+            if future.exception() is not None:
+                logger.error(f"Background call {func.__name__} failed", exc_info=future.exception())
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            executor.submit(func, *args, **kwargs).add_done_callback(log_exception)
+        return wrapper
+    return decorator
+
+
 class GetBG:
     """
     context manager for fastapi.BackgroundTasks
@@ -1,26 +1,48 @@
+import hmac
 import time
 import jwt
 import logging
-from base64 import b64decode, b64encode
 from datetime import datetime, timedelta
-from functools import lru_cache
 from hashlib import sha256
 from math import ceil
 from typing import Union
 
+try:
+    from pybase64 import b64decode, b64encode
+except ImportError:
+    from base64 import b64decode, b64encode
+
 
 from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES
 
 logger = logging.getLogger("marzban")
 
 
-@lru_cache(maxsize=None)
-def get_secret_key():
-    from app.db import GetDB, get_jwt_secret_key
-    with GetDB() as db:
-        key = get_jwt_secret_key(db)
-        logger.debug(f"Retrieved JWT secret key: {key[:10]}...")
-        return key
+# Loaded from the database on first use (or at startup) and then read as plain globals;
+# the token helpers below use `_secret_key or get_secret_key()` on their hot paths
+_secret_key: Union[str, None] = None
+_secret_key_bytes: Union[bytes, None] = None
+
+
+def get_secret_key() -> str:
+    global _secret_key, _secret_key_bytes
+    if _secret_key is None:
+        from app.db import GetDB, get_jwt_secret_key
+        with GetDB() as db:
+            key = get_jwt_secret_key(db)
+            logger.debug(f"Retrieved JWT secret key: {key[:10]}...")
+        _secret_key_bytes = key.encode('utf-8')
+        _secret_key = key
+    return _secret_key
+
+
+def _subscription_signature(u_token: str) -> bytes:
+    """First 10 chars of base64url(sha256(token + secret)), hashed incrementally instead of concatenating."""
+    h = sha256(u_token.encode('utf-8'))
+    if _secret_key_bytes is None:
+        get_secret_key()
+    h.update(_secret_key_bytes)
+    return b64encode(h.digest(), altchars=b'-_')[:10]
 
 
 def create_admin_token(username: str, is_sudo=False) -> str:
@@ -35,7 +57,7 @@ def create_admin_token(username: str, is_sudo=False) -> str:
         expire = now + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
         data["exp"] = expire
     logger.debug(f"Creating admin token with data: {data}")
-    encoded_jwt = jwt.encode(data, get_secret_key(), algorithm="HS256")
+    encoded_jwt = jwt.encode(data, _secret_key or get_secret_key(), algorithm="HS256")
     logger.debug(f"Created admin token: {encoded_jwt[:20]}...")
     return encoded_jwt
 
@@ -50,7 +72,7 @@ def get_admin_payload(token: str) -> Union[dict, None]:
         # Add debug logging for token format
         logger.debug(f"get_admin_payload: Processing token of length {len(token)}, starts with: {token[:20]}...")
         
-        payload = jwt.decode(token, get_secret_key(), algorithms=["HS256"])
+        payload = jwt.decode(token, _secret_key or get_secret_key(), algorithms=["HS256"])
 
         username: str = payload.get("sub")
         access: str = payload.get("access")
@@ -88,12 +110,7 @@ def get_admin_payload(token: str) -> Union[dict, None]:
 def create_subscription_token(account_number: str) -> str:
     data = account_number + ',' + str(ceil(time.time()))
     data_b64_str = b64encode(data.encode('utf-8'), altchars=b'-_').decode('utf-8').rstrip('=')
-    data_b64_sign = b64encode(
-        sha256(
-            (data_b64_str+get_secret_key()).encode('utf-8')
-        ).digest(),
-        altchars=b'-_'
-    ).decode('utf-8')[:10]
+    data_b64_sign = _subscription_signature(data_b64_str).decode('ascii')
     data_final = data_b64_str + data_b64_sign
     return data_final
 
@@ -104,7 +121,7 @@ def get_subscription_payload(token: str) -> Union[dict, None]:
             return
 
         if token.startswith("eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."):
-            payload = jwt.decode(token, get_secret_key(), algorithms=["HS256"])
+            payload = jwt.decode(token, _secret_key or get_secret_key(), algorithms=["HS256"])
             if payload.get("access") == "subscription":
                  return {"account_number": payload['sub'], "created_at": datetime.utcfromtimestamp(payload['iat'])}
             else:
@@ -113,16 +130,14 @@ def get_subscription_payload(token: str) -> Union[dict, None]:
             u_token = token[:-10]
             u_signature = token[-10:]
             try:
-                u_token_dec = b64decode(
-                    (u_token.encode('utf-8') + b'=' * (-len(u_token.encode('utf-8')) % 4)),
-                    altchars=b'-_', validate=True)
+                # Valid tokens are base64url, so anything non-ASCII is rejected here
+                u_token_bytes = u_token.encode('ascii')
+                u_token_dec = b64decode(u_token_bytes + b'=' * (-len(u_token_bytes) & 3), altchars=b'-_', validate=True)
                 u_token_dec_str = u_token_dec.decode('utf-8')
             except:
                 logger.error(f"Error decoding token: {token}")
                 return
-            u_token_resign = b64encode(sha256((u_token+get_secret_key()).encode('utf-8')
-                                              ).digest(), altchars=b'-_').decode('utf-8')[:10]
-            if u_signature == u_token_resign:
+            if hmac.compare_digest(u_signature.encode('utf-8'), _subscription_signature(u_token)):
                 u_account_number = u_token_dec_str.split(',')[0] # Changed from u_username
                 u_created_at = int(u_token_dec_str.split(',')[1])
                 return {"account_number": u_account_number, "created_at": datetime.utcfromtimestamp(u_created_at)}
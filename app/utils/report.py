@@ -1,5 +1,9 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
-from typing import Optional
+from typing import List, Optional, Tuple
+
+import requests
 
 from app import telegram
 from app.db import Session, create_notification_reminder, get_admin_by_id, GetDB
@@ -13,8 +17,10 @@ from app.utils.notification import (Notification, ReachedDaysLeft,
                                     UserLimited, UserSubscriptionRevoked,
                                     UserUpdated, notify)
 from app import discord
+from app.utils.concurrency import pooled_function
 
 from config import (
+    NOTIFY_BACKGROUND_WORKERS,
     NOTIFY_STATUS_CHANGE,
     NOTIFY_USER_CREATED,
     NOTIFY_USER_UPDATED,
@@ -26,14 +32,40 @@ from config import (
     NOTIFY_LOGIN
 )
 
+# Telegram and Discord reports are blocking HTTP calls; run them off the request thread
+_notify_executor = ThreadPoolExecutor(max_workers=NOTIFY_BACKGROUND_WORKERS, thread_name_prefix="notify")
+
+
+# Connection failures are retried with exponential backoff; anything else (including read
+# timeouts, where the message may already have been delivered) is logged on the first failure
+NOTIFY_RETRY_ATTEMPTS = 3
+NOTIFY_RETRY_BASE_DELAY = 0.2
+NOTIFY_RETRY_MAX_DELAY = 2
+
+
+@pooled_function(_notify_executor)
+def _send(report_func, *args, **kwargs) -> None:
+    for attempt in range(NOTIFY_RETRY_ATTEMPTS):
+        try:
+            report_func(*args, **kwargs)
+            return
+        except requests.exceptions.ConnectionError:
+            if attempt == NOTIFY_RETRY_ATTEMPTS - 1:
+                raise
+            time.sleep(min(NOTIFY_RETRY_BASE_DELAY * 2 ** attempt, NOTIFY_RETRY_MAX_DELAY))
+
+
+def _detached(admin):
+    """Copy an ORM admin into the pydantic model so pool threads never touch the caller's session."""
+    if admin is None or isinstance(admin, Admin):
+        return admin
+    return Admin.model_validate(admin)
+
 
 def status_change(
         account_number: str, status: UserStatus, user: UserResponse, user_admin: Admin = None, by: Admin = None) -> None: # Changed username to account_number
     if NOTIFY_STATUS_CHANGE:
-        try:
-            telegram.report_status_change(account_number, status, user_admin) # Changed username to account_number
-        except Exception:
-            pass
+        _send(telegram.report_status_change, account_number, status, _detached(user_admin)) # Changed username to account_number
         if status == UserStatus.limited:
             notify(UserLimited(username=account_number, action=Notification.Type.user_limited, user=user)) # Changed username to account_number
         elif status == UserStatus.expired:
@@ -42,148 +74,134 @@ def status_change(
             notify(UserDisabled(username=account_number, action=Notification.Type.user_disabled, user=user, by=by)) # Changed username to account_number
         elif status == UserStatus.active:
             notify(UserEnabled(username=account_number, action=Notification.Type.user_enabled, user=user, by=by)) # Changed username to account_number
-        try:
-            discord.report_status_change(account_number, status, user_admin) # Changed username to account_number
-        except Exception:
-            pass
+        _send(discord.report_status_change, account_number, status, _detached(user_admin)) # Changed username to account_number
 
 
 def user_created(user: UserResponse, user_id: int, by: Admin, user_admin: Admin = None) -> None:
     if NOTIFY_USER_CREATED:
-        try:
-            telegram.report_new_user(
-                user_id=user_id,
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                expire_date=user.expire,
-                data_limit=user.data_limit,
-                proxies=user.proxies,
-                has_next_plan=user.next_plan is not None,
-                data_limit_reset_strategy=user.data_limit_reset_strategy,
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            telegram.report_new_user,
+            user_id=user_id,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            expire_date=user.expire,
+            data_limit=user.data_limit,
+            proxies=user.proxies,
+            has_next_plan=user.next_plan is not None,
+            data_limit_reset_strategy=user.data_limit_reset_strategy,
+            admin=_detached(user_admin)
+        )
         notify(UserCreated(username=user.account_number, action=Notification.Type.user_created, by=by, user=user)) # Changed from user.username
-        try:
-            discord.report_new_user(
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                expire_date=user.expire,
-                data_limit=user.data_limit,
-                proxies=user.proxies,
-                has_next_plan=user.next_plan is not None,
-                data_limit_reset_strategy=user.data_limit_reset_strategy,
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            discord.report_new_user,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            expire_date=user.expire,
+            data_limit=user.data_limit,
+            proxies=user.proxies,
+            has_next_plan=user.next_plan is not None,
+            data_limit_reset_strategy=user.data_limit_reset_strategy,
+            admin=_detached(user_admin)
+        )
 
 
 def user_updated(user: UserResponse, by: Admin, user_admin: Admin = None) -> None:
     if NOTIFY_USER_UPDATED:
-        try:
-            telegram.report_user_modification(
-                username=user.account_number, # Changed from user.username
-                expire_date=user.expire,
-                data_limit=user.data_limit,
-                proxies=user.proxies,
-                by=by.username, # Assuming Admin model still has username
-                has_next_plan=user.next_plan is not None,
-                data_limit_reset_strategy=user.data_limit_reset_strategy,
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            telegram.report_user_modification,
+            username=user.account_number, # Changed from user.username
+            expire_date=user.expire,
+            data_limit=user.data_limit,
+            proxies=user.proxies,
+            by=by.username, # Assuming Admin model still has username
+            has_next_plan=user.next_plan is not None,
+            data_limit_reset_strategy=user.data_limit_reset_strategy,
+            admin=_detached(user_admin)
+        )
         notify(UserUpdated(username=user.account_number, action=Notification.Type.user_updated, by=by, user=user)) # Changed from user.username
-        try:
-            discord.report_user_modification(
-                username=user.account_number, # Changed from user.username
-                expire_date=user.expire,
-                data_limit=user.data_limit,
-                proxies=user.proxies,
-                by=by.username, # Assuming Admin model still has username
-                has_next_plan=user.next_plan is not None,
-                data_limit_reset_strategy=user.data_limit_reset_strategy,
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            discord.report_user_modification,
+            username=user.account_number, # Changed from user.username
+            expire_date=user.expire,
+            data_limit=user.data_limit,
+            proxies=user.proxies,
+            by=by.username, # Assuming Admin model still has username
+            has_next_plan=user.next_plan is not None,
+            data_limit_reset_strategy=user.data_limit_reset_strategy,
+            admin=_detached(user_admin)
+        )
 
 
 def user_deleted(account_number: str, by: Admin, user_admin: Admin = None) -> None: # Changed username to account_number
     if NOTIFY_USER_DELETED:
-        try:
-            telegram.report_user_deletion(username=account_number, by=by.username, admin=user_admin) # Changed username to account_number
-        except Exception:
-            pass
+        _send(telegram.report_user_deletion, username=account_number, by=by.username, admin=_detached(user_admin)) # Changed username to account_number
         notify(UserDeleted(username=account_number, action=Notification.Type.user_deleted, by=by)) # Changed username to account_number
-        try:
-            discord.report_user_deletion(username=account_number, by=by.username, admin=user_admin) # Changed username to account_number
-        except Exception:
-            pass
+        _send(discord.report_user_deletion, username=account_number, by=by.username, admin=_detached(user_admin)) # Changed username to account_number
+
+
+def users_deleted(deleted: List[Tuple[str, Optional[Admin]]], by: Admin) -> None:
+    """Report a bulk deletion with one Telegram/Discord message per owning admin."""
+    if NOTIFY_USER_DELETED:
+        by_owner = {}
+        for account_number, user_admin in deleted:
+            owner_key = user_admin.username if user_admin else None
+            by_owner.setdefault(owner_key, (user_admin, []))[1].append(account_number)
+            # Webhook notifications are already queued and sent as one JSON array per flush
+            notify(UserDeleted(username=account_number, action=Notification.Type.user_deleted, by=by))
+
+        for user_admin, account_numbers in by_owner.values():
+            _send(telegram.report_users_deletion, usernames=account_numbers, by=by.username, admin=_detached(user_admin))
+            _send(discord.report_users_deletion, usernames=account_numbers, by=by.username, admin=_detached(user_admin))
 
 
 def user_data_usage_reset(user: UserResponse, by: Admin, user_admin: Admin = None) -> None:
     if NOTIFY_USER_DATA_USED_RESET:
-        try:
-            telegram.report_user_usage_reset(
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            telegram.report_user_usage_reset,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            admin=_detached(user_admin)
+        )
         notify(UserDataUsageReset(username=user.account_number, action=Notification.Type.data_usage_reset, by=by, user=user)) # Changed from user.username
-        try:
-            discord.report_user_usage_reset(
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            discord.report_user_usage_reset,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            admin=_detached(user_admin)
+        )
 
 
 def user_data_reset_by_next(user: UserResponse, user_admin: Admin = None) -> None:
     if NOTIFY_USER_DATA_USED_RESET:
-        try:
-            telegram.report_user_data_reset_by_next(
-                user=user, # The user object itself is passed, ensure report_user_data_reset_by_next uses account_number
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            telegram.report_user_data_reset_by_next,
+            user=user, # The user object itself is passed, ensure report_user_data_reset_by_next uses account_number
+            admin=_detached(user_admin)
+        )
         notify(UserDataResetByNext(username=user.account_number, action=Notification.Type.data_reset_by_next, user=user)) # Changed from user.username
-        try:
-            discord.report_user_data_reset_by_next(
-                user=user, # The user object itself is passed, ensure report_user_data_reset_by_next uses account_number
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            discord.report_user_data_reset_by_next,
+            user=user, # The user object itself is passed, ensure report_user_data_reset_by_next uses account_number
+            admin=_detached(user_admin)
+        )
 
 
 def user_subscription_revoked(user: UserResponse, by: Admin, user_admin: Admin = None) -> None:
     if NOTIFY_USER_SUB_REVOKED:
-        try:
-            telegram.report_user_subscription_revoked(
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            telegram.report_user_subscription_revoked,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            admin=_detached(user_admin)
+        )
         notify(UserSubscriptionRevoked(username=user.account_number, # Changed from user.username
                action=Notification.Type.subscription_revoked, by=by, user=user))
-        try:
-            discord.report_user_subscription_revoked(
-                username=user.account_number, # Changed from user.username
-                by=by.username, # Assuming Admin model still has username
-                admin=user_admin
-            )
-        except Exception:
-            pass
+        _send(
+            discord.report_user_subscription_revoked,
+            username=user.account_number, # Changed from user.username
+            by=by.username, # Assuming Admin model still has username
+            admin=_detached(user_admin)
+        )
 
 
 def data_usage_percent_reached(
@@ -204,21 +222,17 @@ def expire_days_reached(db: Session, days: int, user: UserResponse, user_id: int
 
 def login(username: str, password: str, client_ip: str, success: bool) -> None: # This function reports admin logins, username is correct here.
     if NOTIFY_LOGIN:
-        try:
-            telegram.report_login(
-                username=username,
-                password=password,
-                client_ip=client_ip,
-                status="✅ Success" if success else "❌ Failed"
-            )
-        except Exception:
-            pass
-        try:
-            discord.report_login(
-                username=username,
-                password=password,
-                client_ip=client_ip,
-                status="✅ Success" if success else "❌ Failed"
-            )
-        except Exception:
-            pass
\ No newline at end of file
+        _send(
+            telegram.report_login,
+            username=username,
+            password=password,
+            client_ip=client_ip,
+            status="✅ Success" if success else "❌ Failed"
+        )
+        _send(
+            discord.report_login,
+            username=username,
+            password=password,
+            client_ip=client_ip,
+            status="✅ Success" if success else "❌ Failed"
+        )
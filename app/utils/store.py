@@ -1,3 +1,6 @@
+import time
+
+
 class MemoryStorage:
     def __init__(self):
         self._data = {}
@@ -15,6 +18,46 @@ class MemoryStorage:
         self._data.clear()
 
 
+class TTLStorage:
+    def __init__(self, default_ttl: float = 60, max_size: int = 1024):
+        self._data = {}
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+
+    def set(self, key, value, ttl=None):
+        if len(self._data) >= self.max_size:
+            self.prune()
+            if len(self._data) >= self.max_size:
+                self._data.clear()
+        self._data[key] = (time.monotonic() + (self.default_ttl if ttl is None else ttl), value)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in list(self._data) if k.startswith(prefix)]:
+            self._data.pop(key, None)
+
+    def prune(self):
+        now = time.monotonic()
+        for key, (expires_at, _) in list(self._data.items()):
+            if expires_at < now:
+                self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
 class ListStorage(list):
     def __init__(self, update_func):
         super().__init__()
@@ -1,9 +1,10 @@
 import ipaddress
-import math
 import secrets
 import socket
 import time
 from dataclasses import dataclass
+from functools import lru_cache, wraps
+from threading import Lock
 import platform
 import psutil
 import logging
@@ -11,6 +12,8 @@ from typing import Optional
 
 import requests
 
+from app.utils.store import TTLStorage
+
 logger = logging.getLogger("marzban")
 
 
@@ -27,10 +30,32 @@ class CPUStat():
     percent: float
 
 
+# psutil reads parse /proc on every call; dashboards and bots poll these every few seconds, so
+# concurrent callers within the TTL share one reading
+_psutil_cache = TTLStorage(default_ttl=0.5, max_size=16)
+_psutil_lock = Lock()
+
+
+def _psutil_cached(func):
+    @wraps(func)
+    def wrapper():
+        value = _psutil_cache.get(func.__name__)
+        if value is None:
+            with _psutil_lock:
+                value = _psutil_cache.get(func.__name__)
+                if value is None:
+                    value = func()
+                    _psutil_cache.set(func.__name__, value)
+        return value
+    return wrapper
+
+
+@_psutil_cached
 def cpu_usage() -> CPUStat:
     return CPUStat(cores=psutil.cpu_count(), percent=psutil.cpu_percent())
 
 
+@_psutil_cached
 def memory_usage() -> MemoryStat:
     mem = psutil.virtual_memory()
     return MemoryStat(total=mem.total, used=mem.used, free=mem.available)
@@ -86,6 +111,16 @@ def record_realtime_bandwidth() -> None:
     rt_bw.outgoing_packets, rt_bw.packets_sent = round((io.packets_sent - rt_bw.packets_sent) / sample_time), io.packets_sent
 
 
+# CPU percentage sampled by the scheduler every 2 seconds, so get_system_info never has to
+# block for a sample; the import-time call primes psutil's baseline
+cpu_percent_sample: float = psutil.cpu_percent(interval=None)
+
+
+def record_cpu_percent() -> None:
+    global cpu_percent_sample
+    cpu_percent_sample = psutil.cpu_percent(interval=None)
+
+
 def realtime_bandwidth() -> RealtimeBandwidthStat:
     return RealtimeBandwidthStat(
         incoming_bytes=rt_bw.incoming_bytes,
@@ -99,14 +134,11 @@ def random_password() -> str:
     return secrets.token_urlsafe(16)
 
 
-def check_port(port: int) -> bool:
-    """Check if a port is available."""
+def get_free_port() -> int:
+    """Let the kernel pick a free TCP port; one bind instead of probing candidates."""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            s.bind(('', port))
-            return True
-        except OSError:
-            return False
+        s.bind(('', 0))
+        return s.getsockname()[1]
 
 
 def get_public_ip():
@@ -166,20 +198,28 @@ def get_public_ipv6():
     return '[::1]'
 
 
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
+_SIZE_DIVISORS = tuple(1 << (10 * i) for i in range(len(_SIZE_UNITS)))
+
+
+# Data limits and plan sizes repeat across users and renders
+@lru_cache(maxsize=4096)
 def readable_size(size_bytes):
     if size_bytes <= 0:
         return "0 B"
-    size_name = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
-    i = int(math.floor(math.log(size_bytes, 1024)))
-    p = math.pow(1024, i)
-    s = round(size_bytes / p, 2)
-    return f'{s} {size_name[i]}'
+    # floor(log1024(n)) from the bit length; exact at unit boundaries, unlike math.log
+    i = (int(size_bytes).bit_length() - 1) // 10
+    if i < 0:
+        i = 0
+    elif i >= len(_SIZE_UNITS):
+        i = len(_SIZE_UNITS) - 1
+    return f'{round(size_bytes / _SIZE_DIVISORS[i], 2)} {_SIZE_UNITS[i]}'
 
 
 def get_system_info() -> dict:
     """Get system information."""
     try:
-        cpu_percent = psutil.cpu_percent(interval=1)
+        cpu_percent = cpu_percent_sample
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
 
@@ -218,6 +258,7 @@ def get_process_info(pid: int) -> Optional[dict]:
         return None
 
 
+@_psutil_cached
 def get_network_info() -> dict:
     """Get network interface information."""
     try:
@@ -236,6 +277,7 @@ def get_network_info() -> dict:
 
 
 
+@_psutil_cached
 def get_network_io() -> dict:
     """Get network I/O statistics."""
     try:
@@ -1,10 +1,9 @@
 import os # Add os import for path checking
 import logging # Add logging import
-from random import randint
 from typing import TYPE_CHECKING, Dict, Sequence # Keep existing Sequence if used by ProxyHost type hint
 
 from app.utils.store import DictStorage
-from app.utils.system import check_port
+from app.utils.system import get_free_port
 from app.xray.config import XRayConfig
 from app.xray.node import XRayNode
 from xray_api import exceptions, types
@@ -18,30 +17,23 @@ if not logging.getLogger('app').hasHandlers(): # Check against a root app logger
     logging.basicConfig(level=logging.DEBUG)
 
 
-# Search for a free API port for the default config template
+# Pick a free API port for the default config template
 api_port_to_use = 20000 # Default fallback for api_port
 try:
-    for port_candidate in range(randint(10000, 60000), 65536):
-        if not check_port(port_candidate):
-            api_port_to_use = port_candidate
-            break
-    # No need for an else here, api_port_to_use has a default
-finally:
-    # Initialize the global XRayConfig instance
-    actual_xray_config_path = XRAY_CONFIG_PATH
-    logger.info(f"Initializing global XRayConfig instance. Using API port: {api_port_to_use}")
-    logger.info(f"Target XRay config file path: {actual_xray_config_path}")
-
-    if os.path.exists(actual_xray_config_path):
-        config = XRayConfig(base_template_path=actual_xray_config_path, node_api_port=api_port_to_use)
-    else:
-        logger.error(f"CRITICAL: XRayConfig file NOT FOUND at {actual_xray_config_path}. Using default config structure.")
-        config = XRayConfig(base_template_path=None, node_api_port=api_port_to_use)
-
-    # Clean up variables from port search
-    if 'port_candidate' in locals():
-        del port_candidate
-
+    api_port_to_use = get_free_port()
+except OSError as e:
+    logger.warning(f"Could not reserve a free API port ({e}); falling back to {api_port_to_use}.")
+
+# Initialize the global XRayConfig instance
+actual_xray_config_path = XRAY_CONFIG_PATH
+logger.info(f"Initializing global XRayConfig instance. Using API port: {api_port_to_use}")
+logger.info(f"Target XRay config file path: {actual_xray_config_path}")
+
+if os.path.exists(actual_xray_config_path):
+    config = XRayConfig(base_template_path=actual_xray_config_path, node_api_port=api_port_to_use)
+else:
+    logger.error(f"CRITICAL: XRayConfig file NOT FOUND at {actual_xray_config_path}. Using default config structure.")
+    config = XRayConfig(base_template_path=None, node_api_port=api_port_to_use)
 
 
 # No global 'api' client for a local core
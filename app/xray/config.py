@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 from copy import deepcopy
+from itertools import count
 from pathlib import PosixPath
 from typing import Union, List
 
@@ -23,6 +24,10 @@ if DEBUG:
         handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s: %(message)s'))
         logger.addHandler(handler)
 
+# Process-wide, so a version is never reused when xray.config is replaced by a new instance
+_maps_versions = count(1)
+
+
 def merge_dicts(a, b):  # B will override A dictionary key and values
     for key, value in b.items():
         if isinstance(value, dict) and key in a and isinstance(a[key], dict):
@@ -32,6 +37,41 @@ def merge_dicts(a, b):  # B will override A dictionary key and values
     return a
 
 
+def _build_link_inbound(inbound: dict) -> dict:
+    """A copy of an inbound with the fields share links need pulled out of streamSettings.
+
+    'sni' may still contain a '*' wildcard and 'path' may still contain format variables;
+    both are resolved per user when rendering.
+    """
+    link_inbound = inbound.copy()  # Includes port, protocol, settings, streamSettings
+    stream_settings = inbound.get("streamSettings") or {}
+    tls_settings = stream_settings.get("tlsSettings") or {}
+    reality_settings = stream_settings.get("realitySettings") or {}
+    network = stream_settings.get("network", "tcp")
+
+    link_inbound["sni"] = tls_settings.get("serverName") or reality_settings.get("serverName", "")
+    link_inbound["host"] = (stream_settings.get("wsSettings") or {}).get("headers", {}).get("Host") or \
+        (stream_settings.get("httpSettings") or {}).get("headers", {}).get("Host", "")  # For HTTP/2 upg.
+    link_inbound["network"] = network
+    if network == "tcp":
+        link_inbound["header_type"] = (stream_settings.get("tcpSettings") or {}).get("header", {}).get("type", "none")
+    elif network == "grpc":
+        link_inbound["header_type"] = "grpc"
+    else:
+        link_inbound["header_type"] = "none"
+    link_inbound["tls"] = stream_settings.get("security", "")  # 'tls', 'reality', or empty
+    link_inbound["fp"] = tls_settings.get("fingerprint") or reality_settings.get("fingerprint", "")
+    link_inbound["alpn"] = tls_settings.get("alpn", [])
+
+    path = ""
+    if network == "ws" and stream_settings.get("wsSettings"):
+        path = stream_settings["wsSettings"].get("path", "")
+    elif network == "grpc" and stream_settings.get("grpcSettings"):
+        path = stream_settings["grpcSettings"].get("serviceName", "")
+    link_inbound["path"] = path
+    return link_inbound
+
+
 class XRayConfig(dict):
     def __init__(self,
                  base_template_path: Union[str, PosixPath, None] = None,
@@ -93,6 +133,7 @@ class XRayConfig(dict):
         from collections import defaultdict
         self.inbounds_by_protocol = defaultdict(list)
         self.inbounds_by_tag = {}  # Simplified to a flat dict with tag as key
+        self._invalidate_derived_maps()
 
         loaded_inbounds = self.get('inbounds', [])
         if not isinstance(loaded_inbounds, list):
@@ -118,6 +159,33 @@ class XRayConfig(dict):
 
         logger.debug(f"XRayConfig._precompute_inbound_maps: Populated {len(self.inbounds_by_tag)} inbound tags and {len(self.inbounds_by_protocol)} protocols")
 
+    def _invalidate_derived_maps(self):
+        self._inbound_order = None
+        self._link_inbounds_by_tag = None
+        # Bumped on every inbound map change; callers key their own derived caches on it
+        self.maps_version = next(_maps_versions)
+
+    @property
+    def link_inbounds_by_tag(self) -> dict:
+        """Per-tag inbound config with the share-link fields pre-extracted; rebuilt only after the inbound maps change."""
+        if self._link_inbounds_by_tag is None:
+            self._link_inbounds_by_tag = {
+                tag: _build_link_inbound(inbound) for tag, inbound in self.inbounds_by_tag.items()
+            }
+        return self._link_inbounds_by_tag
+
+    @property
+    def inbound_order(self) -> dict:
+        """Position of each tag in inbounds_by_tag; rebuilt only after the inbound maps change."""
+        if self._inbound_order is None:
+            self._inbound_order = {tag: index for index, tag in enumerate(self.inbounds_by_tag)}
+        return self._inbound_order
+
+    @property
+    def enabled_protocols(self) -> frozenset:
+        """Protocols that currently have at least one inbound defined."""
+        return frozenset(protocol for protocol, inbounds in self.inbounds_by_protocol.items() if inbounds)
+
     def _apply_node_api_and_policy(self):
         """Configure API, stats, and policy sections for node management."""
         logger.debug("XRayConfig._apply_node_api_and_policy: Applying node API and policy configuration")
@@ -330,6 +398,7 @@ class XRayConfig(dict):
         # Clear the inbound maps since we're rebuilding
         self.inbounds_by_protocol.clear()
         self.inbounds_by_tag.clear()
+        self._invalidate_derived_maps()
 
         # Add API inbound to maps if it exists
         if api_inbound:
@@ -430,6 +499,7 @@ class XRayConfig(dict):
             if tag and tag in self.inbounds_by_tag:
                 del self.inbounds_by_tag[tag]
 
+        self._invalidate_derived_maps()
         logger.debug(f"XRayConfig._update_inbound_maps: Updated maps after {action} action. "
                     f"Now have {len(self.inbounds_by_tag)} tags and {len(self.inbounds_by_protocol)} protocols")
 
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from typing import TYPE_CHECKING, Optional, Dict, List
 from datetime import datetime
@@ -11,14 +12,18 @@ from app.db import models as db_models
 from app.models.node import NodeStatus
 from app.models.user import UserResponse
 from app.models.proxy import ProxyTypes
-from app.utils.concurrency import threaded_function
+from app.utils.concurrency import pooled_function
 from app.xray.node import XRayNode
 from xray_api.types.account import Account
 from xray_api import XRay as XRayAPI # For type hinting api parameters
+from config import XRAY_BACKGROUND_WORKERS
 
 
 logger = logging.getLogger("marzban")
 
+# Shared, bounded pool for background Xray work so bursts of scheduled tasks cannot flood nodes
+_xray_executor = ThreadPoolExecutor(max_workers=XRAY_BACKGROUND_WORKERS, thread_name_prefix="xray-ops")
+
 
 
 @lru_cache(maxsize=None)
@@ -37,7 +42,7 @@ def get_tls():
         }
 
 
-@threaded_function
+@pooled_function(_xray_executor)
 def _add_user_to_inbound(api: "XRayAPI", inbound_tag: str, account: Account):
     try:
         logger.debug(f"Attempting to add user {account.email} to inbound {inbound_tag} via API: {api}")
@@ -54,7 +59,7 @@ def _add_user_to_inbound(api: "XRayAPI", inbound_tag: str, account: Account):
         pass
 
 
-@threaded_function
+@pooled_function(_xray_executor)
 def _remove_user_from_inbound(api: "XRayAPI", inbound_tag: str, email: str):
     try:
         logger.debug(f"Attempting to remove user {email} from inbound {inbound_tag} via API: {api}")
@@ -71,7 +76,7 @@ def _remove_user_from_inbound(api: "XRayAPI", inbound_tag: str, email: str):
         pass
 
 
-@threaded_function
+@pooled_function(_xray_executor)
 def _alter_inbound_user(api: "XRayAPI", inbound_tag: str, account: Account):
     # This is essentially remove then add.
     email_to_remove = account.email
@@ -107,7 +112,7 @@ def _alter_inbound_user(api: "XRayAPI", inbound_tag: str, account: Account):
         pass
 
 
-@threaded_function
+@pooled_function(_xray_executor)
 def remove_user(account_number: str): # Called when user is fully deleted
     logger.info(f"Xray Ops: Handling XRay cleanup for deleted user {account_number}.")
     with GetDB() as db: # Need DB to find their last active node
@@ -127,7 +132,7 @@ def remove_user(account_number: str): # Called when user is fully deleted
         #    # The router *must* pass the active_node_id if it wants this to work.
         #    pass
 
-@threaded_function
+@pooled_function(_xray_executor)
 def update_user(user_id: int):
     """
     Updates a user's configuration on their active node.
@@ -177,6 +182,36 @@ def update_user(user_id: int):
 def _activate_user_on_xray_node_only(account_number: str, node_id: int):
     """Activate a user on an Xray node without updating the database."""
     logger.info(f"Activating user {account_number} on Xray node {node_id}")
+    _sync_node_active_users(node_id, include_account_number=account_number)
+
+
+@pooled_function(_xray_executor)
+def activate_user_on_node(account_number: str, node_id: int):
+    """Activate a user on a specific node."""
+    logger.info(f"Activating user {account_number} on node {node_id}")
+    with GetDB() as db:
+        db_user = crud.get_user(db, account_number)
+        if not db_user:
+            logger.error(f"User {account_number} not found")
+            return None
+
+        # Update user's active node
+        db_user.active_node_id = node_id
+        db_user.last_status_change = datetime.utcnow()
+        crud.update_user_instance(db, db_user)
+
+        # Activate user on Xray node
+        _activate_user_on_xray_node_only(account_number, node_id)
+
+        # Return updated user with proper context
+        return UserResponse.model_validate(db_user, context={'db': db})
+
+
+def _sync_node_active_users(node_id: int, include_account_number: Optional[str] = None):
+    """
+    Rebuild a node's Xray config from the users currently active on it and restart it once.
+    include_account_number adds that user even if the database doesn't list them on the node yet.
+    """
     with GetDB() as db:
         db_node_orm = crud.get_node_by_id(db, node_id)
         if not db_node_orm:
@@ -189,49 +224,55 @@ def _activate_user_on_xray_node_only(account_number: str, node_id: int):
             return
 
         target_xray_node_instance = xray.nodes.get(node_id)
-        if not target_xray_node_instance:
-            logger.error(f"XRay Node {node_id} not found in xray.nodes")
+        if not target_xray_node_instance or not target_xray_node_instance.connected:
+            logger.error(f"XRay Node {node_id} not found in xray.nodes or not connected")
             return
 
-        if target_xray_node_instance and target_xray_node_instance.connected:
-            try:
-                xray.config.node_api_port = db_node_orm.api_port
-                users_on_node = crud.get_users_by_active_node_id(db, node_id)
-                db_user = crud.get_user(db, account_number)
+        try:
+            xray.config.node_api_port = db_node_orm.api_port
+            users_on_node = crud.get_users_by_active_node_id(db, node_id)
+            if include_account_number:
+                db_user = crud.get_user(db, include_account_number)
                 if db_user and db_user not in users_on_node:
                     users_on_node.append(db_user)
 
-                node_specific_xray_config_obj = xray.config.build_node_config(db_node_orm, users_on_node)
-                target_xray_node_instance.restart(node_specific_xray_config_obj)
-                logger.info(f"Successfully activated user {account_number} on node {node_id}")
-
-            except Exception as e:
-                logger.error(f"Failed to activate user {account_number} on node {node_id}: {e}", exc_info=True)
-                _change_node_status(node_id, NodeStatus.error, message=str(e))
-        else:
-            logger.error(f"XRay Node {node_id} ({db_node_orm.name}) not found or API not available for user {account_number}")
+            node_specific_xray_config_obj = xray.config.build_node_config(db_node_orm, users_on_node)
+            target_xray_node_instance.restart(node_specific_xray_config_obj)
+            logger.info(f"Node {node_id} restarted with {len(users_on_node)} active users")
+        except Exception as e:
+            logger.error(f"Failed to sync active users on node {node_id}: {e}", exc_info=True)
+            _change_node_status(node_id, NodeStatus.error, message=str(e))
 
 
-@threaded_function
-def activate_user_on_node(account_number: str, node_id: int):
-    """Activate a user on a specific node."""
-    logger.info(f"Activating user {account_number} on node {node_id}")
+@pooled_function(_xray_executor)
+def activate_users_on_node(account_numbers: List[str], node_id: int):
+    """Activate a batch of users on one node with a single config rebuild and restart."""
+    logger.info(f"Activating {len(account_numbers)} users on node {node_id}")
     with GetDB() as db:
-        db_user = crud.get_user(db, account_number)
-        if not db_user:
-            logger.error(f"User {account_number} not found")
-            return None
+        now = datetime.utcnow()
+        for db_user in crud.get_users(db, account_numbers=account_numbers):
+            db_user.active_node_id = node_id
+            db_user.last_status_change = now
+        db.commit()
 
-        # Update user's active node
-        db_user.active_node_id = node_id
-        db_user.last_status_change = datetime.utcnow()
-        crud.update_user_instance(db, db_user)
+    _sync_node_active_users(node_id)
 
-        # Activate user on Xray node
-        _activate_user_on_xray_node_only(account_number, node_id)
 
-        # Return updated user with proper context
-        return UserResponse.model_validate(db_user, context={'db': db})
+@pooled_function(_xray_executor)
+def deactivate_users_from_node(account_numbers: List[str], node_id: int):
+    """Deactivate a batch of users from one node with a single config rebuild and restart."""
+    logger.info(f"Deactivating {len(account_numbers)} users from node {node_id}")
+    with GetDB() as db:
+        db.query(db_models.User).filter(
+            db_models.User.account_number.in_([a.lower() for a in account_numbers]),
+            db_models.User.active_node_id == node_id,
+        ).update(
+            {db_models.User.active_node_id: None, db_models.User.last_status_change: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+
+    _sync_node_active_users(node_id)
 
 
 def get_node_specific_inbounds_for_user_proxy_type(node_id: int, proxy_type: ProxyTypes, db: Session) -> List[str]:
@@ -252,7 +293,7 @@ def get_node_specific_inbounds_for_user_proxy_type(node_id: int, proxy_type: Pro
 
     return list(relevant_tags)
 
-@threaded_function
+@pooled_function(_xray_executor)
 def _deactivate_user_from_xray_node_only(account_number: str, node_id: int):
     """
     Deactivates a user from a specific XRay node without modifying the database.
@@ -273,7 +314,7 @@ def _deactivate_user_from_xray_node_only(account_number: str, node_id: int):
         logger.warning(f"XRay Node {node_id} not found or API not available during deactivation for user {account_number}. XRay remove skipped.")
 
 
-@threaded_function
+@pooled_function(_xray_executor)
 def deactivate_user_from_active_node(account_number: str):
     """Deactivate a user from their active node."""
     logger.info(f"Starting deactivate_user_from_active_node operation for user {account_number}")
@@ -422,4 +463,6 @@ __all__ = [
     "remove_node",
     "connect_node",
     "restart_node",
+    "activate_users_on_node",
+    "deactivate_users_from_node",
 ]
\ No newline at end of file
@@ -54,9 +54,11 @@ def get_config(
     """
     with GetDB() as db:
         user: UserResponse = UserResponse.model_validate(utils.get_user(db, username), context={'db': db})
-        conf: str = generate_subscription(
-            user=user, config_format=config_format.name, as_base64=as_base64
+        conf = generate_subscription(
+            user=user, config_format=config_format.name, as_base64=as_base64, reverse=False
         )
+        if isinstance(conf, bytes):
+            conf = conf.decode()
 
         if output_file:
             with open(output_file, "w") as out_file:
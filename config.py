@@ -8,6 +8,8 @@ load_dotenv()
 SQLALCHEMY_DATABASE_URL = config("SQLALCHEMY_DATABASE_URL", default="sqlite:///app/db/marzban.db")
 SQLALCHEMY_POOL_SIZE = config("SQLALCHEMY_POOL_SIZE", cast=int, default=10)
 SQLIALCHEMY_MAX_OVERFLOW = config("SQLIALCHEMY_MAX_OVERFLOW", cast=int, default=30)
+# Threads serving sync endpoints; defaults to one per pooled DB connection
+API_THREADPOOL_SIZE = config("API_THREADPOOL_SIZE", cast=int, default=SQLALCHEMY_POOL_SIZE + SQLIALCHEMY_MAX_OVERFLOW)
 
 UVICORN_HOST = config("UVICORN_HOST", default="0.0.0.0")
 UVICORN_PORT = config("UVICORN_PORT", cast=int, default=8000)
@@ -15,10 +17,14 @@ UVICORN_UDS = config("UVICORN_UDS", default=None)
 UVICORN_SSL_CERTFILE = config("UVICORN_SSL_CERTFILE", default=None)
 UVICORN_SSL_KEYFILE = config("UVICORN_SSL_KEYFILE", default=None)
 UVICORN_SSL_CA_TYPE = config("UVICORN_SSL_CA_TYPE", default="public").lower()
+
+# Key algorithm for the built-in CA and node/panel certificates: "ecdsa" (P-256), "ed25519" or "rsa"
+CERT_KEY_ALGO = config("CERT_KEY_ALGO", default="ecdsa").lower()
 DASHBOARD_PATH = config("DASHBOARD_PATH", default="/dashboard/")
 
 DEBUG = config("DEBUG", default=False, cast=bool)
 DOCS = config("DOCS", default=False, cast=bool)
+RAISE_ON_LAZY_LOAD = config("RAISE_ON_LAZY_LOAD", default=False, cast=bool)
 
 ALLOWED_ORIGINS = config("ALLOWED_ORIGINS", default="*").split(",")
 
@@ -31,6 +37,8 @@ VITE_BASE_API = f"http://127.0.0.1:{UVICORN_PORT}/api/" \
 XRAY_EXCLUDE_INBOUND_TAGS = config("XRAY_EXCLUDE_INBOUND_TAGS", default='').split()
 XRAY_SUBSCRIPTION_URL_PREFIX = config("XRAY_SUBSCRIPTION_URL_PREFIX", default="").strip("/")
 XRAY_SUBSCRIPTION_PATH = config("XRAY_SUBSCRIPTION_PATH", default="sub").strip("/")
+# Upper bound on concurrent background Xray operations (node restarts, inbound user changes)
+XRAY_BACKGROUND_WORKERS = config("XRAY_BACKGROUND_WORKERS", cast=int, default=8)
 
 TELEGRAM_API_TOKEN = config("TELEGRAM_API_TOKEN", default="")
 TELEGRAM_ADMIN_ID = config(
@@ -81,6 +89,8 @@ NOTIFY_USER_SUB_REVOKED = config("NOTIFY_USER_SUB_REVOKED", default=True, cast=b
 NOTIFY_IF_DATA_USAGE_PERCENT_REACHED = config("NOTIFY_IF_DATA_USAGE_PERCENT_REACHED", default=True, cast=bool)
 NOTIFY_IF_DAYS_LEFT_REACHED = config("NOTIFY_IF_DAYS_LEFT_REACHED", default=True, cast=bool)
 NOTIFY_LOGIN = config("NOTIFY_LOGIN", default=True, cast=bool)
+# Threads sending Telegram/Discord reports in the background
+NOTIFY_BACKGROUND_WORKERS = config("NOTIFY_BACKGROUND_WORKERS", cast=int, default=5)
 
 ACTIVE_STATUS_TEXT = config("ACTIVE_STATUS_TEXT", default="Active")
 EXPIRED_STATUS_TEXT = config("EXPIRED_STATUS_TEXT", default="Expired")
@@ -91,6 +101,9 @@ ONHOLD_STATUS_TEXT = config("ONHOLD_STATUS_TEXT", default="On-Hold")
 USERS_AUTODELETE_DAYS = config("USERS_AUTODELETE_DAYS", default=-1, cast=int)
 USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS = config("USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS", default=False, cast=bool)
 
+# Page size for GET /users when the client sends no limit; 0 keeps the listing unbounded
+USERS_PAGE_DEFAULT_LIMIT = config("USERS_PAGE_DEFAULT_LIMIT", cast=int, default=0)
+
 
 # USERNAME: PASSWORD
 SUDOERS = {config("SUDO_USERNAME"): config("SUDO_PASSWORD")} \
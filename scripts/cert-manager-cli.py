@@ -5,7 +5,7 @@ Certificate Management CLI for Marzban
 This CLI provides easy certificate management operations:
 - Generate certificates for new nodes
 - Rotate existing certificates
-- Export certificates for deployment
+- Export certificates for deployment, per node or in bulk
 - Check certificate status
 """
 
@@ -114,6 +114,25 @@ def cmd_export(args):
         print(f"❌ Error: {e}")
         sys.exit(1)
 
+def cmd_export_all(args):
+    """Export certificates for all nodes"""
+    cert_manager, _ = init_system()
+    
+    try:
+        export_dir = args.export_dir or "./certs"
+        exported = cert_manager.export_all_certificates_for_docker(export_dir, args.node_names or None)
+        
+        print(f"📁 Certificates exported for {len(exported)} nodes")
+        print(f"   Export directory: {export_dir}")
+        for node_name, file_paths in exported.items():
+            print(f"   {node_name}:")
+            for name, path in file_paths.items():
+                print(f"     {name}: {path}")
+            
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description="Marzban Certificate Management CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
@@ -144,6 +163,12 @@ def main():
     export_parser.add_argument("--export-dir", help="Directory to export certificates to")
     export_parser.set_defaults(func=cmd_export)
     
+    # Export-all command
+    export_all_parser = subparsers.add_parser("export-all", help="Export certificates for all nodes, one directory per node")
+    export_all_parser.add_argument("node_names", nargs="*", help="Names of the nodes (default: all nodes with certificates)")
+    export_all_parser.add_argument("--export-dir", help="Directory to create the node directories in")
+    export_all_parser.set_defaults(func=cmd_export_all)
+    
     args = parser.parse_args()
     
     if not args.command:
@@ -0,0 +1,57 @@
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from app.db.base import Base
+from app.services.certificate_manager import CertificateManager
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def rsa_manager(db, monkeypatch):
+    monkeypatch.setattr(config, "CERT_KEY_ALGO", "rsa")
+    return CertificateManager(db)
+
+
+def _assert_rsa_pair(cert_info, ca_cert):
+    key = serialization.load_pem_private_key(cert_info.private_key_pem.encode(), password=None)
+    assert isinstance(key, rsa.RSAPrivateKey)
+    assert key.key_size == 2048
+
+    cert = x509.load_pem_x509_certificate(cert_info.certificate_pem.encode())
+    assert cert.public_key().public_numbers() == key.public_key().public_numbers()
+    cert.verify_directly_issued_by(x509.load_pem_x509_certificate(ca_cert.certificate_pem.encode()))
+
+
+class TestRSACertificates:
+    def test_generate_node_certificates(self, rsa_manager):
+        node_certs = rsa_manager.generate_node_certificates("node-a", "127.0.0.1")
+
+        _assert_rsa_pair(node_certs.server_cert, node_certs.ca_cert)
+        _assert_rsa_pair(node_certs.panel_client_cert, node_certs.ca_cert)
+        assert rsa_manager.get_node_certificates("node-a").server_cert.serial_number == \
+            node_certs.server_cert.serial_number
+
+    def test_generate_node_certificates_bulk(self, rsa_manager):
+        nodes = [("node-a", "127.0.0.1"), ("node-b", "example.com"), ("node-c", "10.0.0.3")]
+        generated = rsa_manager.generate_node_certificates_bulk(nodes)
+
+        assert sorted(generated) == ["node-a", "node-b", "node-c"]
+        for node_certs in generated.values():
+            _assert_rsa_pair(node_certs.server_cert, node_certs.ca_cert)
+            _assert_rsa_pair(node_certs.panel_client_cert, node_certs.ca_cert)
+        server_keys = {c.server_cert.private_key_pem for c in generated.values()}
+        client_keys = {c.panel_client_cert.private_key_pem for c in generated.values()}
+        assert len(server_keys | client_keys) == 2 * len(nodes)
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import crud
+from app.db.base import Base
+from app.db.models import Node, Proxy, User, UserUsageResetLogs
+from app.models.proxy import ProxyTypes
+from app.models.user import UserResponse, UserStatus
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    node = Node(name="Test Node", address="127.0.0.1", port=62050, api_port=62051)
+    session.add(node)
+    session.commit()
+
+    for i in range(60):
+        user = User(account_number=f"user{i}", status=UserStatus.active, used_traffic=i, active_node_id=node.id)
+        user.proxies = [Proxy(type=ProxyTypes.VMess, settings={})]
+        user.usage_logs = [UserUsageResetLogs(used_traffic_at_reset=10)]
+        session.add(user)
+    session.commit()
+    session.expunge_all()
+
+    yield session
+    session.close()
+
+
+class TestGetUsers:
+    def test_list_page_has_no_lazy_loads(self, db):
+        with patch.object(crud, "RAISE_ON_LAZY_LOAD", True):
+            users, total = crud.get_users(db, limit=50, return_with_count=True)
+            context = {"db": db, "node_services": {}}
+            responses = [UserResponse.model_validate(u, context=context) for u in users]
+
+        assert len(responses) == 50
+        assert total == 60
+        assert responses[0].lifetime_used_traffic == responses[0].used_traffic + 10
+
+    def test_short_first_page_count(self, db):
+        users, total = crud.get_users(db, limit=100, return_with_count=True)
+        assert len(users) == total == 60
+
+    def test_iter_users_streams_in_batches(self, db):
+        users = list(crud.iter_users(db, batch_size=7))
+        assert [u.id for u in users] == sorted(u.id for u in users)
+        assert len(users) == 60
+        assert all(len(u.proxies) == 1 for u in users)
+
+
+class TestRemoveUsers:
+    def test_remove_users_returning(self, db):
+        ids = [u.id for u in crud.get_users(db, limit=5)]
+        removed = crud.remove_users_returning(db, ids)
+
+        assert len(removed) == 5
+        assert all(active_node_id is not None for _, active_node_id in removed)
+        assert db.query(User).count() == 55
+        assert db.query(Proxy).filter(Proxy.user_id.in_(ids)).count() == 0
+        assert db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id.is_(None)).count() == 5
+
+
+class TestNodeAssignedUsers:
+    def test_split_by_status(self, db):
+        db.query(User).filter(User.account_number.in_(["user0", "user1"])).update(
+            {User.status: UserStatus.disabled}, synchronize_session=False
+        )
+        serving = [UserStatus.active, UserStatus.on_hold]
+
+        assert len(crud.get_node_assigned_users(db, serving)) == 58
+        assert sorted(a for a, _ in crud.get_node_assigned_users(db, serving, exclude=True)) == ["user0", "user1"]